@@ -0,0 +1,147 @@
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from metrics import QUEUE_WAIT
+import asyncio
+import math
+import os
+import time
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+MCP_MAX_IN_FLIGHT = int(os.getenv("MCP_MAX_IN_FLIGHT", "8"))
+MCP_MAX_QUEUE = int(os.getenv("MCP_MAX_QUEUE", "100"))
+MCP_QUEUE_TIMEOUT = float(os.getenv("MCP_QUEUE_TIMEOUT", "30"))
+MCP_MAX_QUEUED_PER_SESSION = int(os.getenv("MCP_MAX_QUEUED_PER_SESSION", "10"))
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted; carries the HTTP status and Retry-After."""
+
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded concurrency limiter with a fair per-session wait queue.
+
+    At most `max_in_flight` requests run at once. Others wait in per-session
+    queues that are served round-robin, so one chatty session can't starve
+    the rest. Requests are rejected right away when the queue is full
+    (503) or their session already has too many queued (429), and give up
+    after `queue_timeout` seconds (503).
+
+    Must only be used from the event loop thread.
+    """
+
+    def __init__(self, max_in_flight=MCP_MAX_IN_FLIGHT, max_queue=MCP_MAX_QUEUE,
+                 queue_timeout=MCP_QUEUE_TIMEOUT, max_queued_per_session=MCP_MAX_QUEUED_PER_SESSION):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_queued_per_session = max_queued_per_session
+        self.in_flight = 0
+        self.queued = 0
+        # session_id -> deque of waiting futures, in round-robin order
+        self.waiters = OrderedDict()
+        # Moving average of how long an admitted request holds its slot
+        self.avg_service_time = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+    def _retry_after(self):
+        return max(1, math.ceil(self.avg_service_time * (self.queued + 1) / self.max_in_flight))
+
+    async def acquire(self, session_id):
+        """Wait for a slot. Returns the time spent queued in seconds."""
+        if self.in_flight < self.max_in_flight and self.queued == 0:
+            self.in_flight += 1
+            self.admitted += 1
+            QUEUE_WAIT.observe(0.0)
+            return 0.0
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(503, "Server is at capacity, try again later", self._retry_after())
+        session_queue = self.waiters.setdefault(session_id, deque())
+        if len(session_queue) >= self.max_queued_per_session:
+            self.rejected += 1
+            raise AdmissionRejected(429, "Too many queued requests for this session", self._retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        session_queue.append(future)
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # A slot was handed over just as we gave up; pass it on
+                self.release()
+            else:
+                future.cancel()
+                self._remove_waiter(session_id, future)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.rejected += 1
+            raise AdmissionRejected(503, "Timed out waiting in the request queue", self._retry_after())
+
+        wait = time.monotonic() - start
+        self.admitted += 1
+        self.total_wait += wait
+        QUEUE_WAIT.observe(wait)
+        return wait
+
+    def release(self, service_time=None):
+        """Free a slot and hand it to the next session in round-robin order."""
+        if service_time is not None:
+            self.avg_service_time = 0.9 * self.avg_service_time + 0.1 * service_time
+        while self.waiters:
+            session_id, session_queue = next(iter(self.waiters.items()))
+            future = session_queue.popleft()
+            self.queued -= 1
+            # Move the session to the back so others go first next time
+            self.waiters.pop(session_id)
+            if session_queue:
+                self.waiters[session_id] = session_queue
+            if not future.done():
+                # The slot passes straight to the waiter; in_flight is unchanged
+                future.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def _remove_waiter(self, session_id, future):
+        session_queue = self.waiters.get(session_id)
+        if session_queue is not None and future in session_queue:
+            session_queue.remove(future)
+            self.queued -= 1
+            if not session_queue:
+                del self.waiters[session_id]
+
+    @asynccontextmanager
+    async def slot(self, session_id):
+        """Hold a slot for the duration of the block."""
+        await self.acquire(session_id)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def get_stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_queue_wait_seconds": self.total_wait / self.admitted if self.admitted else 0.0,
+        }
@@ -0,0 +1,92 @@
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from typing import Any, List
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic stand-in for ChatOpenAI with configurable latency.
+
+    Every turn follows `script`: a list of steps, each a list of
+    (tool_name, args dict) calls, followed by a final answer. Works with
+    both the ReAct agent (one JSON action per step) and the tool-calling
+    agent (all calls of a step at once).
+    """
+
+    script: List[Any] = []
+    latency: float = 0.2
+    jitter: float = 0.0
+    answer: str = "Offline benchmark answer."
+    seed: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-benchmark"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=tools, **kwargs)
+
+    def get_num_tokens(self, text):
+        # Roughly 4 characters per token, like OpenAI's tokenizers on English
+        return max(1, len(text) // 4)
+
+    def get_num_tokens_from_messages(self, messages, tools=None):
+        return sum(self.get_num_tokens(str(message.content)) + 4 for message in messages)
+
+    def _delay(self, messages):
+        # Seeded by the prompt so runs are repeatable; hash() of a str varies per process
+        key = f"{self.seed}\0{len(messages)}\0{str(messages[-1].content)[:64]}"
+        rng = random.Random(int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big"))
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+    def _step(self, messages):
+        """Number of agent steps already taken in the current turn."""
+        turn_start = 0
+        for i, message in enumerate(messages):
+            # ReAct tool observations come back as human messages
+            if isinstance(message, HumanMessage) and not str(message.content).startswith("TOOL RESPONSE"):
+                turn_start = i
+        return sum(1 for message in messages[turn_start + 1:] if isinstance(message, AIMessage))
+
+    def _reply(self, messages, tool_calling):
+        step = self._step(messages)
+        if step < len(self.script):
+            calls = self.script[step]
+            if tool_calling:
+                return AIMessage(content="", tool_calls=[
+                    {"name": name, "args": args, "id": f"call_{step}_{i}"}
+                    for i, (name, args) in enumerate(calls)
+                ])
+            # ReAct takes one call per step, with a single string input
+            name, args = calls[0]
+            action_input = next(iter(args.values()), "")
+            return AIMessage(content=f"```json\n{json.dumps({'action': name, 'action_input': action_input})}\n```")
+        if tool_calling:
+            return AIMessage(content=self.answer)
+        return AIMessage(content=f"```json\n{json.dumps({'action': 'Final Answer', 'action_input': self.answer})}\n```")
+
+    def _result(self, messages, kwargs):
+        message = self._reply(messages, tool_calling="tools" in kwargs)
+        prompt_tokens = self.get_num_tokens_from_messages(messages)
+        completion_tokens = self.get_num_tokens(str(message.content) or json.dumps(message.tool_calls))
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }},
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._delay(messages))
+        return self._result(messages, kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay(messages))
+        return self._result(messages, kwargs)
@@ -0,0 +1,241 @@
+"""Offline benchmark and load test for the MCP API.
+
+Runs server.py in-process with a deterministic fake LLM and a local SQLite
+database (or a local Postgres via --db-url), drives /interact at fixed
+concurrency levels and reports p50/p95/p99 latency, throughput and memory
+per session. No OpenAI calls are made.
+
+    python -m benchmarks.run --concurrency 1,8,32 --requests 200 --llm-latency 0.2
+    python -m benchmarks.run --json new.json --baseline old.json
+
+Settings such as MCP_AGENT_MODE, MCP_MEMORY_MODE or MCP_MAX_IN_FLIGHT are
+read from the environment as usual, so their effect can be compared.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# main.py refuses to import without a key; the fake model never uses it
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+import httpx
+from sqlalchemy import create_engine, text
+
+import main
+import server
+from benchmarks.fake_llm import FakeChatModel
+from session_manager import SessionManager
+from sql_cache import CachedSQLDatabase
+from tool_limits import limit_tools, parse_limits
+
+
+def create_sqlite_db(path, tables, rows):
+    """Create a SQLite stand-in with `tables` tables of `rows` rows each."""
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as connection:
+        for t in range(tables):
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS table_{t} (id INTEGER PRIMARY KEY, name TEXT, value REAL)"
+            ))
+            connection.execute(
+                text(f"INSERT INTO table_{t} (name, value) VALUES (:name, :value)"),
+                [{"name": f"row {i}", "value": i * 1.5} for i in range(rows)]
+            )
+    return engine
+
+
+def build_script(scenario, tables):
+    """Tool calls the fake model makes per turn, grouped into steps.
+
+    "sql" looks at one table; "multi_table" reads the schema of up to five
+    tables and joins them in one query.
+    """
+    if scenario == "chat":
+        return []
+    calls = [("sql_db_list_tables", {"tool_input": ""})]
+    if scenario == "sql":
+        schema_calls = [("sql_db_schema", {"table_names": "table_0"})]
+        query = [("sql_db_query", {"query": "SELECT COUNT(*) FROM table_0"})]
+    else:
+        names = [f"table_{t}" for t in range(min(5, tables))]
+        schema_calls = [("sql_db_schema", {"table_names": name}) for name in names]
+        joins = " ".join(f"JOIN {name} ON {name}.id = table_0.id" for name in names[1:])
+        total = " + ".join(f"{name}.value" for name in names)
+        query = [("sql_db_query", {"query": f"SELECT COUNT(*), SUM({total}) FROM table_0 {joins}"})]
+    if main.MCP_AGENT_MODE == "tool_calling":
+        # Independent lookups go out in one step
+        return [calls, schema_calls, query]
+    return [calls] + [[call] for call in schema_calls] + [query]
+
+
+def build_mcp(args, fake_llm):
+    """Build the base MCP on the fake model and local database, like MCP() would."""
+    if args.db_url:
+        engine = create_engine(args.db_url)
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix="mcp-bench-"), "bench.db")
+        engine = create_sqlite_db(path, args.tables, args.rows)
+    from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+    db = CachedSQLDatabase(
+        engine,
+        schema_ttl=main.MCP_SQL_SCHEMA_TTL,
+        result_cache_size=main.MCP_SQL_RESULT_CACHE_SIZE,
+        result_ttl=main.MCP_SQL_RESULT_TTL
+    )
+    tools = SQLDatabaseToolkit(db=db, llm=fake_llm).get_tools()
+    tools = limit_tools(tools, parse_limits(main.MCP_TOOL_CONCURRENCY), parse_limits(main.MCP_TOOL_TIMEOUTS))
+    base = main.MCP(llm=fake_llm, tools=tools)
+    base.sql_db = db
+    return base
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_level(client, concurrency, requests, sessions, repeat):
+    """Send `requests` /interact calls with `concurrency` workers."""
+    latencies = []
+    errors = 0
+    pending = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in pending:
+            text_input = "How many rows are in table_0?" if repeat else f"How many rows are in table_0? (#{i})"
+            payload = {"text": text_input, "session_id": f"bench-c{concurrency}-s{i % sessions}"}
+            start = time.perf_counter()
+            try:
+                response = await client.post("/interact", json=payload)
+                if response.status_code != 200 or response.json()["response"].startswith("Error:"):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def measure_session_memory(base, fake_llm, count):
+    """Average bytes retained per session after one turn each."""
+    registry = SessionManager(base, max_sessions=count + 1, ttl=0)
+    latency = fake_llm.latency
+    fake_llm.latency = 0
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        await registry.get(f"mem-{i}").ainteract("How many rows are in table_0?")
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    fake_llm.latency = latency
+    return (after - before) / count
+
+
+def compare(results, baseline):
+    """Print percentage changes against a baseline run."""
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    print("\nChange vs baseline (positive latency / negative throughput = regression):")
+    for level in results["levels"]:
+        old = previous.get(level["concurrency"])
+        if old is None:
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if old[key]:
+                changes.append(f"{key} {100 * (level[key] - old[key]) / old[key]:+.1f}%")
+        print(f"  c={level['concurrency']}: " + ", ".join(changes))
+    if baseline.get("bytes_per_session"):
+        delta = results["bytes_per_session"] - baseline["bytes_per_session"]
+        print(f"  memory per session: {100 * delta / baseline['bytes_per_session']:+.1f}%")
+
+
+async def run(args):
+    fake_llm = FakeChatModel(
+        script=build_script(args.scenario, args.tables),
+        latency=args.llm_latency,
+        jitter=args.llm_jitter
+    )
+    base = build_mcp(args, fake_llm)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=None)
+    else:
+        # Drive the real app in-process, skipping the startup build of MCP()
+        server.mcp = base
+        server.sessions = SessionManager(base)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=None)
+
+    results = {
+        "agent_mode": main.MCP_AGENT_MODE,
+        "memory_mode": main.MCP_MEMORY_MODE,
+        "scenario": args.scenario,
+        "llm_latency": args.llm_latency,
+        "levels": [],
+    }
+    async with client:
+        for concurrency in args.concurrency:
+            level = await run_level(client, concurrency, args.requests, args.sessions, args.repeat)
+            results["levels"].append(level)
+            print(
+                f"c={concurrency:<4} rps={level['throughput_rps']:8.2f}  p50={level['p50_ms']:8.1f}ms  "
+                f"p95={level['p95_ms']:8.1f}ms  p99={level['p99_ms']:8.1f}ms  errors={level['errors']}"
+            )
+
+    results["bytes_per_session"] = await measure_session_memory(base, fake_llm, args.memory_sessions)
+    print(f"memory per session: {results['bytes_per_session'] / 1024:.1f} KiB")
+    base.close()
+    return results
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the MCP API")
+    parser.add_argument("--concurrency", type=lambda v: [int(c) for c in v.split(",")], default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--sessions", type=int, default=16, help="distinct session ids per level")
+    parser.add_argument("--repeat", action="store_true", help="send identical questions (exercises caches and coalescing)")
+    parser.add_argument("--scenario", choices=["chat", "sql", "multi_table"], default="sql")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--db-url", help="local database to use instead of a temporary SQLite file")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--memory-sessions", type=int, default=50)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against results from an earlier --json run")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main_cli(sys.argv[1:])
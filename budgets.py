@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from metrics import LIMITS_HIT
+import threading
+import time
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Budget of the request being processed; copied into tool and DB worker threads
+current_budget = ContextVar("request_budget", default=None)
+# Postgres backends held by the tool call running in this context (see tool_limits.py)
+current_call_pids = ContextVar("call_backend_pids", default=None)
+
+
+def backend_pid_sets():
+    """Return the sets that should record a Postgres backend checked out in this context."""
+    sets = []
+    budget = current_budget.get()
+    if budget is not None:
+        sets.append(budget.backend_pids)
+    call_pids = current_call_pids.get()
+    if call_pids is not None:
+        sets.append(call_pids)
+    return sets
+
+
+class BudgetExceeded(Exception):
+    """Raised to stop an agent run once a request budget is used up."""
+
+    def __init__(self, limit, message):
+        super().__init__(message)
+        self.limit = limit
+
+
+class RequestBudget:
+    """Wall-clock deadline and token budget of one request.
+
+    Also tracks the Postgres backends the request is using so they can be
+    cancelled server-side when the deadline passes.
+    """
+
+    def __init__(self, timeout=None, max_tokens=None):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.max_tokens = max_tokens
+        self.tokens_used = 0
+        self.backend_pids = set()
+        self.limits_hit = []
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        """Seconds left before the deadline, or None without one."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def record(self, limit):
+        """Note that a limit was hit during this request."""
+        with self.lock:
+            if limit not in self.limits_hit:
+                self.limits_hit.append(limit)
+        LIMITS_HIT.inc(limit=limit.split(":", 1)[0])
+        logger.warning(f"Request limit hit: {limit}")
+
+    def add_tokens(self, tokens):
+        with self.lock:
+            self.tokens_used += tokens
+            return self.max_tokens is not None and self.tokens_used > self.max_tokens
+
+
+@contextmanager
+def request_budget(timeout=None, max_tokens=None):
+    """Use the current request budget, or start a new one for this block."""
+    budget = current_budget.get()
+    if budget is not None:
+        yield budget
+        return
+    budget = RequestBudget(timeout=timeout, max_tokens=max_tokens)
+    token = current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        current_budget.reset(token)
@@ -0,0 +1,93 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from budgets import BudgetExceeded
+from metrics import LLM_CALLS, LLM_DURATION, LLM_TOKENS, TOOL_CALLS, TOOL_DURATION
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# LangChain callbacks of an agent run. Kept apart from budgets.py and tracing.py
+# so those stay importable without LangChain.
+
+
+class TokenBudgetCallback(BaseCallbackHandler):
+    """Counts LLM tokens of a request and aborts the run once over budget."""
+
+    # Let BudgetExceeded propagate instead of being logged and ignored
+    raise_error = True
+
+    def __init__(self, budget):
+        self.budget = budget
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if self.budget.add_tokens(usage.get("total_tokens", 0)):
+            raise BudgetExceeded(
+                "max_tokens",
+                f"token budget of {self.budget.max_tokens} exceeded ({self.budget.tokens_used} used)"
+            )
+        if self.budget.expired():
+            raise BudgetExceeded("request_timeout", f"request deadline of {self.budget.timeout}s exceeded")
+
+
+class TracingCallback(BaseCallbackHandler):
+    """Builds the request's span tree and feeds the LLM and tool metrics."""
+
+    # Cheap bookkeeping; no need to hop to an executor
+    run_inline = True
+
+    def __init__(self, trace):
+        self.trace = trace
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+        self.trace.start_span(run_id, parent_run_id, name, "chain")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self.trace.end_span(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.trace.end_span(run_id, "error")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self.trace.start_span(run_id, parent_run_id, kwargs.get("name") or "llm", "llm")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self.trace.start_span(run_id, parent_run_id, kwargs.get("name") or "chat_model", "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span, duration = self.trace.end_span(run_id)
+        LLM_CALLS.inc(status="ok")
+        LLM_DURATION.observe(duration)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, kind="completion")
+        with self.trace.lock:
+            self.trace.prompt_tokens += prompt_tokens
+            self.trace.completion_tokens += completion_tokens
+        if span is not None:
+            span.attributes.update({"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens})
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        _, duration = self.trace.end_span(run_id, "error")
+        LLM_CALLS.inc(status="error")
+        LLM_DURATION.observe(duration)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "tool"
+        self.trace.start_span(run_id, parent_run_id, name, "tool")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        span, duration = self.trace.end_span(run_id)
+        if span is not None:
+            TOOL_CALLS.inc(tool=span.name, status="ok")
+            TOOL_DURATION.observe(duration, tool=span.name)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        span, duration = self.trace.end_span(run_id, "error")
+        if span is not None:
+            TOOL_CALLS.inc(tool=span.name, status="error")
+            TOOL_DURATION.observe(duration, tool=span.name)
@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+import re
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def normalize_input(text):
+    """Collapse whitespace so trivially different inputs share a key.
+
+    Case is kept: inputs may carry case-sensitive literals (names, SQL strings).
+    """
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def context_fingerprint(memory, text=""):
+    """Hash the conversation history a request for text would be answered with.
+
+    For a memory that retrieves older exchanges by relevance (see
+    conversation_memory.RetrievalMemory), the retrieved ones count too.
+    """
+    digest = hashlib.sha256()
+    for message in memory.chat_memory.messages:
+        digest.update(f"{message.type}\0{message.content}\0".encode("utf-8"))
+    digest.update(getattr(memory, "moving_summary_buffer", "").encode("utf-8"))
+    retrieve = getattr(memory, "retrieve", None)
+    if retrieve is not None:
+        digest.update(b"\1")
+        for exchange in retrieve(text):
+            digest.update(f"{exchange['user']}\0{exchange['model']}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """Shares one in-flight execution between concurrent callers with the same key.
+
+    Must only be used from the event loop thread.
+    """
+
+    def __init__(self):
+        # key -> future of the leader's result
+        self.calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key, fn):
+        """Await fn(), or the result of an identical call already in flight.
+
+        Returns (result, shared) where shared is True for followers.
+        """
+        future = self.calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled, not us: run it ourselves
+                logger.debug("Coalesced leader was cancelled, running independently")
+                return await fn(), False
+
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        self.leaders += 1
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Followers retrieve the exception; mark it retrieved for the leader too
+            future.exception()
+            raise
+        finally:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+
+    def get_stats(self):
+        return {"in_flight": len(self.calls), "leaders": self.leaders, "coalesced": self.coalesced}
@@ -0,0 +1,120 @@
+import json
+import os
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CLEAR = "clear"
+SUMMARY = "summary"
+_BLOCK_SIZE = 64 * 1024
+
+
+class AppendLog:
+    """Append-only JSONL log of context records.
+
+    Each line is a JSON object with a "type" field. Saving only appends new
+    records; a "clear" record marks everything before it as dead. A
+    "summary" record may carry "kept", the number of records right before it
+    that were not folded into the summary; older ones are dead too. Once
+    `compact_every` records have been appended, the file is rewritten with
+    only the live records and the latest summary.
+    """
+
+    def __init__(self, path, compact_every=1000):
+        self.path = path
+        self.compact_every = compact_every
+        self.appended = 0
+
+    def append(self, records):
+        """Append records to the end of the log."""
+        if not records:
+            return
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+        self.appended += len(records)
+        if self.compact_every > 0 and self.appended >= self.compact_every:
+            self.compact()
+
+    def read_live(self):
+        """Return every record after the last clear marker, oldest first."""
+        records = []
+        with open(self.path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("type") == CLEAR:
+                    records = []
+                else:
+                    records.append(record)
+        return records
+
+    def tail(self, n, record_type, with_summary=False):
+        """Return the last n live records of record_type without reading the whole file.
+
+        n=None returns all of them. With with_summary=True, also keep
+        scanning back for the latest summary record and skip the records it
+        folded in. Returns (records oldest first, summary record or None).
+        """
+        limit = float("inf") if n is None else n
+        records = []
+        summary = None
+        for record in self._reverse_records():
+            kind = record.get("type")
+            if kind == CLEAR:
+                break
+            if kind == SUMMARY and summary is None:
+                summary = record
+                if with_summary and "kept" in record:
+                    limit = min(limit, len(records) + record["kept"])
+            elif kind == record_type and len(records) < limit:
+                records.append(record)
+            if len(records) >= limit and (summary is not None or not with_summary):
+                break
+        records.reverse()
+        return records, summary
+
+    def compact(self):
+        """Rewrite the log with only the live records and the latest summary."""
+        live = self.read_live()
+        last_summary = max((i for i, record in enumerate(live) if record.get("type") == SUMMARY), default=None)
+        kept = []
+        if last_summary is not None:
+            summary = live[last_summary]
+            older = [record for record in live[:last_summary] if record.get("type") != SUMMARY]
+            if "kept" in summary:
+                # Drop what the summary already covers
+                older = older[len(older) - summary["kept"]:] if summary["kept"] else []
+            # Moved in front of everything it keeps
+            kept.append({**summary, "kept": 0} if "kept" in summary else summary)
+            kept.extend(older)
+            live = live[last_summary + 1:]
+        kept.extend(record for record in live if record.get("type") != SUMMARY)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in kept))
+        os.replace(tmp_path, self.path)
+        self.appended = 0
+        logger.info(f"Compacted {self.path} to {len(kept)} records")
+
+    def _reverse_records(self):
+        """Yield parsed records from the end of the file backwards."""
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b""
+            while position > 0:
+                read_size = min(_BLOCK_SIZE, position)
+                position -= read_size
+                f.seek(position)
+                lines = (f.read(read_size) + remainder).split(b"\n")
+                # The first piece may be a partial line; finish it with the next block
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    if line.strip():
+                        yield json.loads(line)
+            if remainder.strip():
+                yield json.loads(remainder)
@@ -1,14 +1,129 @@
+from array import array
+from bisect import bisect_left, bisect_right
 from datetime import datetime
+from context_log import AppendLog, CLEAR
 import json
 import logging
+import sys
+import time
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+
+def _to_epoch(timestamp):
+    """Accept an epoch float, a datetime or an ISO string."""
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return datetime.fromisoformat(timestamp).timestamp()
+
+
+class ExchangeBuffer:
+    """Fixed-capacity ring buffer of exchanges.
+
+    Timestamps live in an array of doubles and user/model text in two
+    parallel lists, so an exchange costs three slots plus its strings
+    instead of a dict and an ISO timestamp string. Once `capacity` is
+    reached the oldest exchange is overwritten. `total` counts every
+    exchange appended since the last clear and gives each one a stable
+    sequence number.
+    """
+
+    __slots__ = ("capacity", "timestamps", "users", "models", "start", "total")
+
+    def __init__(self, capacity=1000):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self):
+        # Storage grows up to capacity and is then reused in place
+        self.timestamps = array("d")
+        self.users = []
+        self.models = []
+        self.start = 0
+        self.total = 0
+
+    def __len__(self):
+        return len(self.users)
+
+    def append(self, timestamp, user_input, model_response):
+        # Keep timestamps non-decreasing so range lookups can bisect
+        if self.users:
+            timestamp = max(timestamp, self.timestamps[(self.start - 1) % len(self.users)])
+        if len(self.users) < self.capacity:
+            self.timestamps.append(timestamp)
+            self.users.append(user_input)
+            self.models.append(model_response)
+        else:
+            self.timestamps[self.start] = timestamp
+            self.users[self.start] = user_input
+            self.models[self.start] = model_response
+            self.start = (self.start + 1) % self.capacity
+        self.total += 1
+
+    def _slot(self, i):
+        return (self.start + i) % len(self.users)
+
+    def timestamp_at(self, i):
+        return self.timestamps[self._slot(i)]
+
+    def entry(self, i):
+        """Return the i-th oldest exchange as a dict."""
+        slot = self._slot(i)
+        return {
+            "timestamp": datetime.fromtimestamp(self.timestamps[slot]).isoformat(),
+            "user": self.users[slot],
+            "model": self.models[slot]
+        }
+
+    def entries(self, first=0, last=None):
+        last = len(self) if last is None else last
+        return [self.entry(i) for i in range(first, last)]
+
+    def oldest_seq(self):
+        """Sequence number of the oldest exchange still held."""
+        return self.total - len(self)
+
+    def memory_usage(self):
+        """Bytes held by the buffer, including the exchange strings."""
+        size = sys.getsizeof(self.timestamps) + sys.getsizeof(self.users) + sys.getsizeof(self.models)
+        size += sum(sys.getsizeof(text) for text in self.users)
+        size += sum(sys.getsizeof(text) for text in self.models)
+        return size
+
+
+class _TimestampView:
+    """Read-only sequence over the buffer's timestamps, oldest first, for bisect."""
+
+    __slots__ = ("buffer",)
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def __getitem__(self, i):
+        return self.buffer.timestamp_at(i)
+
+
 class MCPContextManager:
-    def __init__(self):
-        self.context = []
+    def __init__(self, store=None, session_id="default", compact_every=1000, capacity=1000, index=None):
+        # Optional persistent store that receives every exchange (see context_store.py)
+        self.store = store
+        # Optional full-text index that receives every exchange (see context_search.py)
+        self.index = index
+        self.session_id = session_id
+        self.context = ExchangeBuffer(capacity)
+        # JSONL filename -> sequence number of the next exchange to append to it
+        self.persisted = {}
+        self.logs = {}
+        self.compact_every = compact_every
         self.metadata = {
             "created_at": datetime.now().isoformat(),
             "updated_at": datetime.now().isoformat(),
@@ -17,77 +132,227 @@ class MCPContextManager:
 
     def add_context(self, user_input, model_response):
         """Add a conversation exchange to the context with timestamp."""
-        timestamp = datetime.now().isoformat()
-        
-        entry = {
-            "timestamp": timestamp,
-            "user": user_input,
-            "model": model_response
-        }
-        
-        self.context.append(entry)
-        self.metadata["updated_at"] = timestamp
+        now = time.time()
+
+        self.context.append(now, user_input, model_response)
+        self.metadata["updated_at"] = datetime.fromtimestamp(now).isoformat()
         self.metadata["message_count"] += 1
-        
+
+        if self.store is not None:
+            self.store.add(self.session_id, user_input, model_response)
+        self._index(now, user_input, model_response)
+
         logger.debug(f"Added context entry. Total entries: {len(self.context)}")
 
+    def restore(self, exchanges):
+        """Append exchanges that are already persisted, without sending them to the store."""
+        for exchange in exchanges:
+            timestamp = _to_epoch(exchange["timestamp"])
+            self.context.append(timestamp, exchange["user"], exchange["model"])
+            self._index(timestamp, exchange["user"], exchange["model"])
+        self.metadata["message_count"] = len(self.context)
+
+    def _index(self, timestamp, user_input, model_response):
+        if self.index is None:
+            return
+        try:
+            self.index.add(self.session_id, user_input, model_response, timestamp, self.context.oldest_seq())
+        except Exception as e:
+            logger.error(f"Error indexing exchange: {str(e)}")
+
+    def replace(self, exchanges, metadata=None):
+        """Replace the context with exchanges that are already persisted elsewhere."""
+        self._replace_context(exchanges)
+        if metadata is not None:
+            self.metadata = dict(metadata)
+        self.metadata["message_count"] = len(self.context)
+        # Append logs no longer match the context; rewrite them on their next save
+        for filename in self.persisted:
+            self.persisted[filename] = None
+
+    def merge(self, exchanges, metadata=None):
+        """Bring the context up to date with the latest exchanges persisted elsewhere.
+
+        exchanges are the most recent ones, oldest first. If they overlap the
+        end of the context only the new ones are added, so the search index
+        is not rebuilt; otherwise the context is replaced.
+        """
+        overlap = self._overlap(exchanges)
+        if overlap is None:
+            self.replace(exchanges, metadata)
+            return
+        self.restore(exchanges[overlap:])
+        if metadata is not None:
+            self.metadata = dict(metadata)
+        self.metadata["message_count"] = len(self.context)
+
+    def _overlap(self, exchanges):
+        """Number of leading exchanges that repeat the end of the context, or None."""
+        size = len(self.context)
+        if not size:
+            return 0
+        for count in range(min(size, len(exchanges)), 0, -1):
+            if self.context.entries(size - count) == exchanges[:count]:
+                return count
+        return None
+
+    def release(self):
+        """Drop this session's exchanges from the search index."""
+        if self.index is not None:
+            self.index.clear(self.session_id)
+
     def clear_context(self):
         """Clear the conversation context but preserve metadata."""
-        self.context = []
+        self.context.clear()
+        self.release()
         self.metadata["updated_at"] = datetime.now().isoformat()
         self.metadata["message_count"] = 0
+        # Append logs need a clear marker on their next save
+        for filename in self.persisted:
+            self.persisted[filename] = None
         logger.info("Context cleared")
 
     def get_context(self):
-        """Return the current context."""
-        return self.context
+        """Return a copy of the current context, oldest first."""
+        return self.context.entries()
 
     def get_last_n_exchanges(self, n=5):
         """Get the last n conversation exchanges."""
-        return self.context[-n:] if n < len(self.context) else self.context
+        size = len(self.context)
+        return self.context.entries(max(0, size - n), size)
+
+    def get_exchanges_between(self, start=None, end=None):
+        """Get the exchanges with start <= timestamp <= end.
+
+        Bounds may be epoch seconds, datetimes or ISO strings; None leaves
+        that side open.
+        """
+        timestamps = _TimestampView(self.context)
+        first = 0 if start is None else bisect_left(timestamps, _to_epoch(start))
+        last = len(self.context) if end is None else bisect_right(timestamps, _to_epoch(end))
+        return self.context.entries(first, max(first, last))
+
+    def get_stats(self):
+        """Return size and memory use of the in-process context."""
+        size = len(self.context)
+        usage = self.context.memory_usage()
+        return {
+            "exchanges": size,
+            "capacity": self.context.capacity,
+            "bytes": usage,
+            "bytes_per_exchange": usage / size if size else 0
+        }
 
     def show_context(self):
         """Print the current context to console."""
-        if not self.context:
+        if not len(self.context):
             print("Context is empty.")
             return
-            
+
         print(f"\n=== Context ({len(self.context)} entries) ===")
-        for i, entry in enumerate(self.context):
+        for i in range(len(self.context)):
+            entry = self.context.entry(i)
             print(f"\n--- Exchange {i+1} ({entry['timestamp']}) ---")
             print(f"User: {entry['user']}")
             print(f"Model: {entry['model']}")
         print("\n=== End of Context ===")
 
     def save_to_file(self, filename="context_history.json"):
-        """Save the context and metadata to a JSON file."""
+        """Save the context and metadata to a JSON file.
+
+        A .jsonl filename appends only the exchanges added since the last save.
+        """
+        if filename.endswith(".jsonl"):
+            return self._append_to_log(filename)
         try:
             data = {
                 "metadata": self.metadata,
-                "context": self.context
+                "context": self.get_context()
             }
-            
+
             with open(filename, "w") as f:
                 json.dump(data, f, indent=2)
-                
+
             logger.info(f"Context saved to {filename}")
             return True
         except Exception as e:
             logger.error(f"Error saving context to file: {str(e)}")
             return False
 
-    def load_from_file(self, filename="context_history.json"):
-        """Load context and metadata from a JSON file."""
+    def _get_log(self, filename):
+        if filename not in self.logs:
+            self.logs[filename] = AppendLog(filename, compact_every=self.compact_every)
+        return self.logs[filename]
+
+    def _append_to_log(self, filename):
+        try:
+            saved = self.persisted.get(filename, 0)
+            records = []
+            if saved is None:
+                records.append({"type": CLEAR, "timestamp": datetime.now().isoformat()})
+                saved = 0
+            oldest = self.context.oldest_seq()
+            if saved < oldest:
+                logger.warning(f"{oldest - saved} exchanges left the context buffer before being saved to {filename}")
+                saved = oldest
+            records.extend({"type": "exchange", **entry} for entry in self.context.entries(saved - oldest))
+
+            self._get_log(filename).append(records)
+            self.persisted[filename] = self.context.total
+
+            logger.info(f"Appended {len(records)} records to {filename}")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving context to file: {str(e)}")
+            return False
+
+    def _replace_context(self, exchanges):
+        self.context.clear()
+        self.release()
+        for exchange in exchanges:
+            timestamp = _to_epoch(exchange["timestamp"])
+            self.context.append(timestamp, exchange["user"], exchange["model"])
+            self._index(timestamp, exchange["user"], exchange["model"])
+
+    def load_from_file(self, filename="context_history.json", last_n=None):
+        """Load context and metadata from a JSON file.
+
+        For a .jsonl log, last_n loads only the most recent exchanges.
+        """
+        if filename.endswith(".jsonl"):
+            return self._load_from_log(filename, last_n)
         try:
             with open(filename, "r") as f:
                 data = json.load(f)
-                
+
             self.metadata = data.get("metadata", self.metadata)
-            self.context = data.get("context", [])
-            
+            self._replace_context(data.get("context", []))
+
             # Update timestamp
             self.metadata["updated_at"] = datetime.now().isoformat()
-            
+
+            logger.info(f"Context loaded from {filename}: {len(self.context)} entries")
+            return True
+        except FileNotFoundError:
+            logger.warning(f"Context file not found: {filename}")
+            return False
+        except Exception as e:
+            logger.error(f"Error loading context from file: {str(e)}")
+            return False
+
+    def _load_from_log(self, filename, last_n):
+        try:
+            log = self._get_log(filename)
+            if last_n is None:
+                records = [record for record in log.read_live() if record.get("type") == "exchange"]
+            else:
+                records, _ = log.tail(last_n, "exchange")
+
+            self._replace_context(records)
+            self.persisted[filename] = self.context.total
+            self.metadata["message_count"] = len(self.context)
+            self.metadata["updated_at"] = datetime.now().isoformat()
+
             logger.info(f"Context loaded from {filename}: {len(self.context)} entries")
             return True
         except FileNotFoundError:
@@ -99,9 +364,10 @@ class MCPContextManager:
 
     def summarize_context(self):
         """Return a summary of the context."""
+        size = len(self.context)
         return {
             "metadata": self.metadata,
-            "total_exchanges": len(self.context),
-            "first_timestamp": self.context[0]["timestamp"] if self.context else None,
-            "last_timestamp": self.context[-1]["timestamp"] if self.context else None
-        }
\ No newline at end of file
+            "total_exchanges": size,
+            "first_timestamp": self.context.entry(0)["timestamp"] if size else None,
+            "last_timestamp": self.context.entry(size - 1)["timestamp"] if size else None
+        }
@@ -0,0 +1,118 @@
+import re
+import sqlite3
+import threading
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+# Longer questions are cut to this many distinct terms before matching
+_MAX_QUERY_TERMS = 32
+# Exchanges that left the context buffer are deleted once this many have piled up
+_PRUNE_BATCH = 100
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query that matches any of its words."""
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if len(word) > 1 and word not in terms:
+            terms.append(word)
+    return " OR ".join(f'"{term}"' for term in terms[:_MAX_QUERY_TERMS])
+
+
+class ExchangeIndex:
+    """Local full-text index over conversation exchanges (SQLite FTS5, BM25 ranking).
+
+    Exchanges are added one at a time as they are recorded, so the index
+    never has to be rebuilt. One index is shared by all sessions of a
+    process; every exchange carries its session_id and a per-session
+    sequence number. A session keeps only the exchanges its context buffer
+    still holds. Runs entirely offline.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS exchanges USING fts5("
+            "user, model, session_id UNINDEXED, seq UNINDEXED, timestamp UNINDEXED, "
+            "tokenize='porter unicode61')"
+        )
+        # session_id -> sequence number of its latest exchange
+        self.last_seq = {}
+        # session_id -> sequence number up to which its exchanges were deleted
+        self.pruned = {}
+
+    def _last_seq(self, session_id):
+        if session_id not in self.last_seq:
+            row = self.connection.execute(
+                "SELECT MAX(seq) FROM exchanges WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            self.last_seq[session_id] = row[0] or 0
+        return self.last_seq[session_id]
+
+    def add(self, session_id, user_input, model_response, timestamp=None, dropped=0):
+        """Index one exchange.
+
+        dropped is the number of the session's exchanges that have left the
+        caller's context buffer; their rows are deleted in batches.
+        """
+        with self.lock:
+            seq = self._last_seq(session_id) + 1
+            self.connection.execute(
+                "INSERT INTO exchanges (user, model, session_id, seq, timestamp) VALUES (?, ?, ?, ?, ?)",
+                (user_input, model_response, session_id, seq, timestamp)
+            )
+            if dropped - self.pruned.get(session_id, 0) >= _PRUNE_BATCH:
+                self.connection.execute(
+                    "DELETE FROM exchanges WHERE session_id = ? AND seq <= ?", (session_id, dropped)
+                )
+                self.pruned[session_id] = dropped
+            self.connection.commit()
+            self.last_seq[session_id] = seq
+
+    def search(self, session_id, text, k=3, skip_last=0):
+        """Return up to k exchanges of a session most relevant to text, oldest first.
+
+        The latest `skip_last` exchanges are left out, since they are
+        already in the recent history.
+        """
+        query = build_match_query(text)
+        if not query or k <= 0:
+            return []
+        with self.lock:
+            newest = self._last_seq(session_id) - skip_last
+            if newest <= 0:
+                return []
+            rows = self.connection.execute(
+                "SELECT user, model, timestamp, seq FROM exchanges "
+                "WHERE exchanges MATCH ? AND session_id = ? AND seq <= ? "
+                "ORDER BY bm25(exchanges) LIMIT ?",
+                (query, session_id, newest, k)
+            ).fetchall()
+        rows.sort(key=lambda row: row[3])
+        return [{"user": user, "model": model, "timestamp": timestamp} for user, model, timestamp, _ in rows]
+
+    def clear(self, session_id):
+        """Drop every indexed exchange of a session."""
+        with self.lock:
+            self.connection.execute("DELETE FROM exchanges WHERE session_id = ?", (session_id,))
+            self.connection.commit()
+            self.last_seq.pop(session_id, None)
+            self.pruned.pop(session_id, None)
+
+    def get_stats(self):
+        """Return the number of indexed exchanges and sessions."""
+        with self.lock:
+            exchanges, sessions = self.connection.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT session_id) FROM exchanges"
+            ).fetchone()
+        return {"exchanges": exchanges, "sessions": sessions, "path": self.path}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
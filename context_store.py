@@ -0,0 +1,152 @@
+from datetime import datetime, timezone
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from database import Context, SessionLocal, get_engine, init_db
+import queue
+import threading
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Attempts to insert a session's rows when another writer takes the same seq numbers first
+SEQ_CONFLICT_RETRIES = 5
+# Attempts to write a failing batch once close() was called
+SHUTDOWN_RETRIES = 3
+
+
+class PostgresContextStore:
+    """Write-behind store for conversation exchanges in the context_history table.
+
+    `add` only enqueues; a background thread drains the queue and writes
+    batches of up to `batch_size` rows in one transaction, at least every
+    `flush_interval` seconds. A batch that fails is retried with
+    exponential backoff up to `max_retry_delay` seconds.
+
+    Sequence numbers are assigned by the database (max(seq) + 1 inside the
+    INSERT), so several processes can write the same session.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=1.0, max_queue=10000, max_retry_delay=30.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retry_delay = max_retry_delay
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.retries = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Create the table if needed and start the flusher thread."""
+        get_engine()
+        init_db()
+        self._thread = threading.Thread(target=self._run, name="context-store-flusher", daemon=True)
+        self._thread.start()
+        logger.info("Context store started")
+
+    def add(self, session_id, user_input, model_response, timestamp=None):
+        """Enqueue an exchange for writing. Never blocks on the database."""
+        item = (session_id, timestamp or datetime.now(timezone.utc), user_input, model_response)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"Context store queue full, dropped exchange for session {session_id}")
+
+    def get_last_n(self, session_id, n=5):
+        """Return the last n exchanges of a session, oldest first."""
+        get_engine()
+        with SessionLocal() as db:
+            rows = db.execute(
+                select(Context.created_at, Context.user_input, Context.model_response)
+                .where(Context.session_id == session_id)
+                .order_by(Context.seq.desc())
+                .limit(n)
+            ).all()
+        return [
+            {"timestamp": row.created_at.isoformat(), "user": row.user_input, "model": row.model_response}
+            for row in reversed(rows)
+        ]
+
+    def close(self, timeout=5.0):
+        """Stop the flusher thread after writing everything still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        logger.info(f"Context store closed ({self.written} written, {self.dropped} dropped)")
+
+    def _run(self):
+        batch = []
+        failures = 0
+        while not (self._stop.is_set() and self.queue.empty() and not batch):
+            try:
+                if not batch:
+                    batch.append(self.queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                continue
+            if self._flush(batch):
+                batch = []
+                failures = 0
+                continue
+
+            failures += 1
+            self.retries += 1
+            if self._stop.is_set() and failures >= SHUTDOWN_RETRIES:
+                self.dropped += len(batch)
+                logger.error(f"Giving up on {len(batch)} exchanges at shutdown")
+                batch = []
+                continue
+            delay = min(self.max_retry_delay, self.flush_interval * 2 ** (failures - 1))
+            logger.warning(f"Retrying {len(batch)} exchanges in {delay:.1f}s")
+            self._stop.wait(delay)
+
+    def _flush(self, batch):
+        """Write a batch in one transaction. Returns False if it has to be retried."""
+        by_session = {}
+        for session_id, timestamp, user_input, model_response in batch:
+            by_session.setdefault(session_id, []).append((timestamp, user_input, model_response))
+        try:
+            with SessionLocal() as db:
+                for session_id, rows in by_session.items():
+                    self._insert_rows(db, session_id, rows)
+                db.commit()
+            self.written += len(batch)
+            logger.debug(f"Flushed {len(batch)} exchanges to context_history")
+            return True
+        except Exception as e:
+            logger.error(f"Error flushing context history: {str(e)}")
+            return False
+
+    def _insert_rows(self, db, session_id, rows):
+        # Every row's subquery sees the table as it was before the INSERT, so offsets keep them distinct
+        last_seq = (
+            select(func.coalesce(func.max(Context.seq), 0))
+            .where(Context.session_id == session_id)
+            .scalar_subquery()
+        )
+        statement = insert(Context).values([
+            {
+                "session_id": session_id,
+                "seq": last_seq + offset,
+                "created_at": timestamp,
+                "user_input": user_input,
+                "model_response": model_response,
+            }
+            for offset, (timestamp, user_input, model_response) in enumerate(rows, 1)
+        ])
+        for attempt in range(SEQ_CONFLICT_RETRIES):
+            try:
+                with db.begin_nested():
+                    db.execute(statement)
+                return
+            except IntegrityError:
+                # Another process wrote this session concurrently; re-read max(seq) and try again
+                if attempt == SEQ_CONFLICT_RETRIES - 1:
+                    raise
@@ -0,0 +1,160 @@
+from langchain.memory import ConversationBufferWindowMemory, ConversationSummaryBufferMemory
+from langchain.memory.utils import get_prompt_input_key
+from langchain_core.messages import AIMessage, HumanMessage, get_buffer_string
+from typing import Any
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class TokenBudgetMemory(ConversationSummaryBufferMemory):
+    """Conversation memory capped by a token budget.
+
+    The last `keep_last_n` exchanges are always kept verbatim. When the
+    buffer goes over `max_token_limit`, the oldest messages are folded into
+    the running summary, which is extended from the previous summary rather
+    than recomputed from the whole history.
+    """
+
+    keep_last_n: int = 3
+    # Tokens the full, unsummarized history would have cost
+    raw_history_tokens: int = 0
+    last_prompt_tokens: int = 0
+    last_tokens_saved: int = 0
+
+    def save_context(self, inputs, outputs):
+        """Save an exchange, prune the buffer and record the tokens saved."""
+        self._count_raw_tokens(inputs, outputs)
+        super().save_context(inputs, outputs)
+        self._record_prompt_tokens()
+
+    async def asave_context(self, inputs, outputs):
+        """Async save_context(); the agent's ainvoke() saves memory through this."""
+        self._count_raw_tokens(inputs, outputs)
+        await super().asave_context(inputs, outputs)
+        self._record_prompt_tokens()
+
+    def prune(self):
+        """Fold the oldest messages into the summary while over budget."""
+        pruned_memory = self._pop_over_budget()
+        if pruned_memory:
+            self.moving_summary_buffer = self.predict_new_summary(pruned_memory, self.moving_summary_buffer)
+            logger.debug(f"Folded {len(pruned_memory)} messages into the running summary")
+
+    async def aprune(self):
+        """Async prune()."""
+        pruned_memory = self._pop_over_budget()
+        if pruned_memory:
+            self.moving_summary_buffer = await self.apredict_new_summary(pruned_memory, self.moving_summary_buffer)
+            logger.debug(f"Folded {len(pruned_memory)} messages into the running summary")
+
+    def _pop_over_budget(self):
+        """Remove and return the oldest unprotected messages while the buffer is over budget."""
+        buffer = self.chat_memory.messages
+        protected = 2 * self.keep_last_n
+        current_tokens = self.llm.get_num_tokens_from_messages(buffer)
+        pruned_memory = []
+        while current_tokens > self.max_token_limit and len(buffer) > protected:
+            pruned_memory.append(buffer.pop(0))
+            current_tokens = self.llm.get_num_tokens_from_messages(buffer)
+        return pruned_memory
+
+    def _count_raw_tokens(self, inputs, outputs):
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        self.raw_history_tokens += self.llm.get_num_tokens(input_str) + self.llm.get_num_tokens(output_str)
+
+    def _record_prompt_tokens(self):
+        self.last_prompt_tokens = self._current_prompt_tokens()
+        self.last_tokens_saved = max(0, self.raw_history_tokens - self.last_prompt_tokens)
+        logger.info(
+            f"Memory: {self.last_prompt_tokens} prompt tokens, "
+            f"{self.last_tokens_saved} tokens saved by summarization"
+        )
+
+    def _current_prompt_tokens(self):
+        tokens = self.llm.get_num_tokens_from_messages(self.chat_memory.messages)
+        if self.moving_summary_buffer:
+            tokens += self.llm.get_num_tokens(self.moving_summary_buffer)
+        return tokens
+
+    def get_stats(self):
+        """Return token usage of the memory."""
+        return {
+            "buffered_messages": len(self.chat_memory.messages),
+            "summary_tokens": self.llm.get_num_tokens(self.moving_summary_buffer) if self.moving_summary_buffer else 0,
+            "prompt_tokens": self.last_prompt_tokens,
+            "raw_history_tokens": self.raw_history_tokens,
+            "tokens_saved": self.last_tokens_saved,
+        }
+
+    def clear(self):
+        """Clear the buffer, the summary and the token counters."""
+        super().clear()
+        self.raw_history_tokens = 0
+        self.last_prompt_tokens = 0
+        self.last_tokens_saved = 0
+
+
+class RetrievalMemory(ConversationBufferWindowMemory):
+    """Recent turns plus the past exchanges most relevant to the question.
+
+    Only the last `k` exchanges are kept verbatim. Older history is looked
+    up in an ExchangeIndex (see context_search.py) and the `top_k` best
+    matches are put in front of the recent turns, so the prompt stays the
+    same size however long the conversation gets.
+    """
+
+    index: Any = None
+    session_id: str = "default"
+    top_k: int = 3
+    last_retrieved: int = 0
+
+    def load_memory_variables(self, inputs):
+        """Return the retrieved exchanges followed by the recent window."""
+        messages = []
+        if self.index is not None:
+            input_key = self.input_key or get_prompt_input_key(inputs, self.memory_variables)
+            retrieved = self.retrieve(str(inputs[input_key]))
+            for exchange in retrieved:
+                messages.append(HumanMessage(content=exchange["user"]))
+                messages.append(AIMessage(content=exchange["model"]))
+            self.last_retrieved = len(retrieved)
+        messages.extend(self.buffer_as_messages)
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)}
+
+    def retrieve(self, text):
+        """Return the past exchanges outside the window most relevant to text."""
+        if self.index is None:
+            return []
+        try:
+            return self.index.search(self.session_id, text, self.top_k, skip_last=self.k)
+        except Exception as e:
+            logger.error(f"Error searching past exchanges: {str(e)}")
+            return []
+
+    def save_context(self, inputs, outputs):
+        """Save an exchange and drop messages that fell out of the window."""
+        super().save_context(inputs, outputs)
+        self._trim()
+
+    async def asave_context(self, inputs, outputs):
+        """Async save_context(); the agent's ainvoke() saves memory through this."""
+        await super().asave_context(inputs, outputs)
+        self._trim()
+
+    def _trim(self):
+        messages = self.chat_memory.messages
+        excess = len(messages) - 2 * self.k
+        if excess > 0:
+            del messages[:excess]
+
+    def get_stats(self):
+        """Return the size of the recent window and of the last retrieval."""
+        return {
+            "buffered_messages": len(self.chat_memory.messages),
+            "retrieved_exchanges": self.last_retrieved,
+        }
@@ -1,10 +1,15 @@
-from sqlalchemy import create_engine, Column, String, Text
+from sqlalchemy import create_engine, event, inspect, text, Column, String, Text, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 import os
+import threading
+import time
+import logging
 from dotenv import load_dotenv
 from sqlalchemy import Integer
 
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
@@ -18,23 +23,206 @@ DATABASE_URL = (
     f"{os.getenv('POSTGRES_DB')}"
 )
 
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Server-side statement_timeout for every pooled connection; 0 disables it.
+# The default matches MCP_REQUEST_TIMEOUT so no statement outlives its request.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "120000"))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.perf_counter() - start
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+
 # Initialize SQLAlchemy
 Base = declarative_base()
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Bound to the shared engine by get_engine()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+_engine = None
+_engine_lock = threading.Lock()
+# Installed by set_request_hooks(); keeps this module free of the agent-side imports
+_pid_sets = None
+_query_observer = None
+
+
+def set_request_hooks(pid_sets=None, query_observer=None):
+    """Tie pooled connections to the request being processed.
+
+    pid_sets() returns the sets (e.g. of the current request and tool call)
+    that collect the backend pid of every connection checked out, so the
+    statements can be cancelled. query_observer(seconds) receives the
+    duration of every query.
+    """
+    global _pid_sets, _query_observer
+    _pid_sets = pid_sets
+    _query_observer = query_observer
+
+
+def get_engine():
+    """Return the process-wide pooled engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                connect_args = {}
+                if DB_STATEMENT_TIMEOUT_MS > 0:
+                    connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+                _engine = create_engine(
+                    DATABASE_URL,
+                    connect_args=connect_args,
+                    poolclass=TimedQueuePool,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=DB_POOL_PRE_PING,
+                )
+                event.listen(_engine, "checkout", _track_backend_pid)
+                event.listen(_engine, "checkin", _untrack_backend_pid)
+                event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+                event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+                SessionLocal.configure(bind=_engine)
+    return _engine
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    if _query_observer is not None:
+        _query_observer(elapsed)
+
+
+def _track_backend_pid(dbapi_connection, connection_record, connection_proxy):
+    # Remember which backend the current request and tool call use so they can be cancelled
+    owners = _pid_sets() if _pid_sets is not None else []
+    if not owners:
+        return
+    if "backend_pid" not in connection_record.info:
+        get_backend_pid = getattr(dbapi_connection, "get_backend_pid", None)
+        if get_backend_pid is None:
+            return
+        connection_record.info["backend_pid"] = get_backend_pid()
+    pid = connection_record.info["backend_pid"]
+    for pids in owners:
+        pids.add(pid)
+    connection_record.info["pid_owners"] = owners
+
+
+def _untrack_backend_pid(dbapi_connection, connection_record):
+    pid = connection_record.info.get("backend_pid")
+    for pids in connection_record.info.pop("pid_owners", []):
+        pids.discard(pid)
+
+
+def cancel_backends(pids):
+    """Cancel the running statements of the given Postgres backends."""
+    if not pids:
+        return
+    with get_engine().connect() as connection:
+        for pid in list(pids):
+            connection.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": pid})
+
+
+def get_pool_stats():
+    """Return usage and wait time of the shared connection pool."""
+    if _engine is None:
+        return None
+    pool = _engine.pool
+    stats = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats["checkouts"] = pool.checkouts
+        stats["avg_wait_seconds"] = pool.total_wait / pool.checkouts if pool.checkouts else 0.0
+        stats["max_wait_seconds"] = pool.max_wait
+    return stats
 
 # Define the Context model
 class Context(Base):
     __tablename__ = "context_history"
     id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String(255), nullable=False, default="default")
+    seq = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
     user_input = Column(Text)
     model_response = Column(Text)
 
+    __table_args__ = (
+        # Reading the last N exchanges of a session is a range scan on this index
+        Index("ix_context_history_session_seq", "session_id", "seq", unique=True),
+        Index("ix_context_history_created_at", "created_at"),
+    )
+
+# Session memory and context shared between workers (see session_state.py)
+class SessionState(Base):
+    __tablename__ = "session_state"
+    session_id = Column(String(255), primary_key=True)
+    # Bumped on every save so workers can tell whether their cached copy is stale
+    version = Column(Integer, nullable=False)
+    state = Column(Text, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+# Columns added to context_history after its first release, for tables created before them
+_CONTEXT_HISTORY_MIGRATION = (
+    "ALTER TABLE context_history ADD COLUMN IF NOT EXISTS session_id VARCHAR(255) NOT NULL DEFAULT 'default'",
+    "ALTER TABLE context_history ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+    "ALTER TABLE context_history ADD COLUMN IF NOT EXISTS seq INTEGER",
+    # Existing rows keep their insertion order
+    "UPDATE context_history SET seq = id WHERE seq IS NULL",
+    "ALTER TABLE context_history ALTER COLUMN seq SET NOT NULL",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_context_history_session_seq ON context_history (session_id, seq)",
+    "CREATE INDEX IF NOT EXISTS ix_context_history_created_at ON context_history (created_at)",
+)
+
 # Create the database tables
-Base.metadata.create_all(bind=engine)
+def init_db():
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+    _migrate_context_history(engine)
+
+def _migrate_context_history(engine):
+    """Add the session columns to a context_history table created by an older version."""
+    columns = {column["name"] for column in inspect(engine).get_columns("context_history")}
+    missing = {"session_id", "seq", "created_at"} - columns
+    if not missing:
+        return
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError(f"context_history is missing columns {sorted(missing)}; migrate it by hand")
+    with engine.begin() as connection:
+        for statement in _CONTEXT_HISTORY_MIGRATION:
+            connection.execute(text(statement))
+    logger.info(f"Migrated context_history: added {sorted(missing)}")
 
 # Function to get a database session
 def get_db():
+    get_engine()
     db = SessionLocal()
     try:
         yield db
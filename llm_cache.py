@@ -0,0 +1,193 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from tracing import record_cache_lookup
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Set per request to skip the cache for non-deterministic use
+_cache_bypass = ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_cache(enabled=True):
+    """Skip the LLM response cache for calls made inside this block."""
+    token = _cache_bypass.set(enabled)
+    try:
+        yield
+    finally:
+        _cache_bypass.reset(token)
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so prompts that only differ in spacing share a key."""
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+class InMemoryLRUBackend:
+    """In-process LRU store of cache entries."""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        # key -> (created_at, generations)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, generations):
+        with self.lock:
+            self.entries[key] = (time.time(), generations)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteBackend:
+    """On-disk store of cache entries, evicting the least recently used beyond max_entries."""
+
+    def __init__(self, path="llm_cache.db", max_entries=10000):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, created_at REAL, last_access REAL, generations TEXT)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT created_at, generations FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        return row[0], [loads(gen) for gen in json.loads(row[1])]
+
+    def set(self, key, generations):
+        now = time.time()
+        payload = json.dumps([dumps(gen) for gen in generations])
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, created_at, last_access, generations) VALUES (?, ?, ?, ?)",
+                (key, now, now, payload)
+            )
+            self.conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self.conn.commit()
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+class ResponseCache(BaseCache):
+    """LangChain LLM cache keyed by normalized prompt, model settings and tool set.
+
+    `llm_string` carries the model name, temperature and any bound tools;
+    `tool_set` adds the agent's tool names so different toolkits never share
+    entries. Entries older than `ttl` seconds are treated as misses.
+    """
+
+    def __init__(self, backend, ttl=3600, tool_set=""):
+        self.backend = backend
+        self.ttl = ttl
+        self.tool_set = tool_set
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, prompt, llm_string):
+        raw = "\n".join([normalize_prompt(prompt), llm_string, self.tool_set])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        if _cache_bypass.get():
+            return None
+        key = self._key(prompt, llm_string)
+        entry = self.backend.get(key)
+        if entry is not None and self.ttl > 0 and time.time() - entry[0] > self.ttl:
+            self.backend.delete(key)
+            entry = None
+        record_cache_lookup(entry is not None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def update(self, prompt, llm_string, return_val):
+        if _cache_bypass.get():
+            return
+        self.backend.set(self._key(prompt, llm_string), return_val)
+
+    def clear(self, **kwargs):
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self):
+        """Return hit/miss counters and the current number of entries."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.backend),
+        }
+
+
+def create_cache(mode, ttl=3600, max_entries=1000, path="llm_cache.db", tool_set=""):
+    """Build a ResponseCache for MCP_LLM_CACHE mode "memory" or "sqlite", or None."""
+    if mode == "memory":
+        backend = InMemoryLRUBackend(max_entries=max_entries)
+    elif mode == "sqlite":
+        backend = SQLiteBackend(path=path, max_entries=max_entries)
+    else:
+        return None
+    logger.info(f"LLM response cache enabled ({mode}, ttl={ttl}s, max_entries={max_entries})")
+    return ResponseCache(backend, ttl=ttl, tool_set=tool_set)
@@ -1,27 +1,19 @@
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
-from langchain_mcp_adapters.tools import load_mcp_tools
-from langchain_openai import ChatOpenAI
-from langchain.agents import initialize_agent, AgentType
-from langchain.chains import ConversationChain 
-from langchain.memory import ConversationBufferMemory
-from langchain_community.agent_toolkits.github.toolkit import GitHubToolkit
-from langchain_community.agent_toolkits.gitlab.toolkit import GitLabToolkit
-
-from langchain_community.utilities.github import GitHubAPIWrapper
-from langchain_community.utilities.gitlab import GitLabAPIWrapper
-
-from langchain_community.utilities.sql_database import SQLDatabase
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-
-#import openai
-from openai import OpenAI
+# LangChain, the OpenAI client, toolkits, the SQL stack and the context store
+# are imported where they are first used so that importing this module stays cheap.
+
 from dotenv import load_dotenv
 import os
 import json
 from context_manager import MCPContextManager
+from context_log import AppendLog, CLEAR, SUMMARY
+from budgets import BudgetExceeded, RequestBudget, backend_pid_sets, current_budget, request_budget
+from contextvars import copy_context
+from coalescing import SingleFlight, normalize_input, context_fingerprint
+from tracing import RequestTrace, current_trace, log_trace, record_db_time, request_trace
 import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -29,8 +21,6 @@ logger = logging.getLogger(__name__)
 # Load env var
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-#Init openAI api
-OpenAI.api_key = OPENAI_API_KEY
 
 if not OPENAI_API_KEY:
     raise ValueError("OpenAI API KEY not found!")
@@ -61,89 +51,346 @@ POSTGRES_DB = os.getenv("POSTGRES_DB")
 '''if not all([POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB]):
     raise ValueError("PostgreSQL credentials not found.")'''
 
+#async execution
+# MCP_ASYNC_AGENT=false routes every request through the worker pool instead of agent.ainvoke
+MCP_ASYNC_AGENT = os.getenv("MCP_ASYNC_AGENT", "true").lower() == "true"
+MCP_WORKER_THREADS = int(os.getenv("MCP_WORKER_THREADS", "8"))
+
+#memory
+# MCP_MEMORY_MODE=summary caps the history at MCP_MEMORY_TOKEN_BUDGET tokens with a rolling summary
+# MCP_MEMORY_MODE=retrieval keeps the last MCP_MEMORY_KEEP_LAST exchanges plus the
+# MCP_RETRIEVAL_TOP_K past exchanges most relevant to the question (local full-text search)
+MCP_MEMORY_MODE = os.getenv("MCP_MEMORY_MODE", "buffer").lower()
+MCP_MEMORY_TOKEN_BUDGET = int(os.getenv("MCP_MEMORY_TOKEN_BUDGET", "2000"))
+MCP_MEMORY_KEEP_LAST = int(os.getenv("MCP_MEMORY_KEEP_LAST", "3"))
+MCP_RETRIEVAL_TOP_K = int(os.getenv("MCP_RETRIEVAL_TOP_K", "3"))
+
+#agent
+# MCP_AGENT_MODE=tool_calling uses OpenAI tool calling, which can run several tool calls per step concurrently
+MCP_AGENT_MODE = os.getenv("MCP_AGENT_MODE", "react").lower()
+# MCP_AGENT_VERBOSE=true prints the agent trace of every request; otherwise pass verbose per request
+MCP_AGENT_VERBOSE = os.getenv("MCP_AGENT_VERBOSE", "false").lower() == "true"
+# Max concurrent calls per tool group, e.g. "sql=4,default=8"
+MCP_TOOL_CONCURRENCY = os.getenv("MCP_TOOL_CONCURRENCY", "sql=4")
+# Per-call timeout in seconds per tool group, e.g. "sql=20,default=60"
+MCP_TOOL_TIMEOUTS = os.getenv("MCP_TOOL_TIMEOUTS", "default=60")
+# Wall-clock deadline, agent step budget and LLM token budget of one request (0 disables the token budget)
+MCP_REQUEST_TIMEOUT = float(os.getenv("MCP_REQUEST_TIMEOUT", "120"))
+MCP_MAX_ITERATIONS = int(os.getenv("MCP_MAX_ITERATIONS", "10"))
+MCP_MAX_REQUEST_TOKENS = int(os.getenv("MCP_MAX_REQUEST_TOKENS", "0")) or None
+# Output of AgentExecutor when max_iterations or max_execution_time stops it
+AGENT_STOPPED_MESSAGE = "Agent stopped due to iteration limit or time limit."
+# Tags the agent's own LLM calls, so streaming skips those made by memory and tools
+AGENT_LLM_TAG = "mcp_agent_llm"
+
+#request coalescing
+# Concurrent requests with the same input and the same history share one agent run
+MCP_COALESCE_REQUESTS = os.getenv("MCP_COALESCE_REQUESTS", "false").lower() == "true"
+
+#llm response cache
+# MCP_LLM_CACHE: none, memory or sqlite
+MCP_LLM_CACHE = os.getenv("MCP_LLM_CACHE", "none").lower()
+MCP_LLM_CACHE_TTL = float(os.getenv("MCP_LLM_CACHE_TTL", "3600"))
+MCP_LLM_CACHE_SIZE = int(os.getenv("MCP_LLM_CACHE_SIZE", "1000"))
+MCP_LLM_CACHE_PATH = os.getenv("MCP_LLM_CACHE_PATH", "llm_cache.db")
+
+#sql schema cache
+# MCP_SQL_SCHEMA_TTL=0 keeps cached schema until it is invalidated
+MCP_SQL_SCHEMA_TTL = float(os.getenv("MCP_SQL_SCHEMA_TTL", "0"))
+MCP_SQL_SCHEMA_PRELOAD = os.getenv("MCP_SQL_SCHEMA_PRELOAD", "false").lower() == "true"
+# MCP_SQL_RESULT_CACHE_SIZE=0 disables the read-only query result cache
+MCP_SQL_RESULT_CACHE_SIZE = int(os.getenv("MCP_SQL_RESULT_CACHE_SIZE", "0"))
+MCP_SQL_RESULT_TTL = float(os.getenv("MCP_SQL_RESULT_TTL", "60"))
+
+#external MCP tool servers
+# MCP_SERVERS_CONFIG points to a JSON file of stdio servers, e.g. {"mcpServers": {"name": {"command": ..., "args": [...]}}}
+MCP_SERVERS_CONFIG = os.getenv("MCP_SERVERS_CONFIG")
+MCP_SERVER_POOL_SIZE = int(os.getenv("MCP_SERVER_POOL_SIZE", "1"))
+MCP_SERVER_HEALTH_INTERVAL = float(os.getenv("MCP_SERVER_HEALTH_INTERVAL", "30"))
+
+#context persistence
+# MCP_CONTEXT_STORE=postgres writes every exchange to the context_history table in the background
+MCP_CONTEXT_STORE = os.getenv("MCP_CONTEXT_STORE", "none").lower()
+MCP_CONTEXT_BATCH_SIZE = int(os.getenv("MCP_CONTEXT_BATCH_SIZE", "100"))
+MCP_CONTEXT_FLUSH_INTERVAL = float(os.getenv("MCP_CONTEXT_FLUSH_INTERVAL", "1.0"))
+# Number of stored exchanges loaded into a new session's memory
+MCP_CONTEXT_RESTORE_LAST = int(os.getenv("MCP_CONTEXT_RESTORE_LAST", "5"))
+# .jsonl context files are append-only and compacted after this many appended records
+MCP_CONTEXT_COMPACT_EVERY = int(os.getenv("MCP_CONTEXT_COMPACT_EVERY", "1000"))
+# Exchanges kept in each session's in-process context; older ones are overwritten
+MCP_CONTEXT_CAPACITY = int(os.getenv("MCP_CONTEXT_CAPACITY", "1000"))
+
+
+def install_db_hooks():
+    """Let database.py attribute pooled connections and query time to the current request."""
+    from database import set_request_hooks
+    set_request_hooks(backend_pid_sets, record_db_time)
+
 
 class MCP:
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            api_key=OPENAI_API_KEY,
-            temperature=0.7,
-            max_tokens=500
-        )
+    def __init__(self, llm=None, tools=None, executor=None, context_store=None, session_id="default", single_flight=None, context_index=None):
+        # llm, tools, executor, context_store, single_flight and context_index can be passed in to share them between sessions
+        self.session_id = session_id
+        # Version of this session in the shared session-state backend (see session_state.py)
+        self.state_version = None
+        # Context sequence number (see ExchangeBuffer.total) at the last load or save of that state
+        self.state_synced = 0
+        self.state_lock = threading.Lock()
+        self.single_flight = single_flight or SingleFlight()
+        if llm is None:
+            from langchain_openai import ChatOpenAI
+            from llm_cache import create_cache
+            self.llm = ChatOpenAI(
+                model="gpt-3.5-turbo",
+                api_key=OPENAI_API_KEY,
+                temperature=0.7,
+                max_tokens=500
+            )
+            self.llm.cache = create_cache(
+                MCP_LLM_CACHE,
+                ttl=MCP_LLM_CACHE_TTL,
+                max_entries=MCP_LLM_CACHE_SIZE,
+                path=MCP_LLM_CACHE_PATH
+            )
+        else:
+            self.llm = llm
         #init memoru to store cnv history
-        self.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+        self.context_index = context_index if context_index is not None else self._create_context_index()
+        self.memory = self._create_memory()
         #init 
-        self.context_manager = MCPContextManager()
+        self.context_store = context_store if llm is not None else self._create_context_store()
+        self.context_manager = MCPContextManager(
+            store=self.context_store,
+            session_id=session_id,
+            compact_every=MCP_CONTEXT_COMPACT_EVERY,
+            capacity=MCP_CONTEXT_CAPACITY,
+            index=self.context_index
+        )
+        # .jsonl filename -> append state of the memory log
+        self.memory_logs = {}
+        #bounded pool for sync work that must stay off the event loop
+        self.executor = executor or ThreadPoolExecutor(max_workers=MCP_WORKER_THREADS, thread_name_prefix="mcp-worker")
+
         #init tools
-        self.tools = self._initialize_tools()
+        self.sql_db = None
+        self.mcp_server_pool = None
+        self.tools = tools if tools is not None else self._initialize_tools()
+        if llm is None and self.llm.cache is not None:
+            # Key cached responses on the tool set as well
+            self.llm.cache.tool_set = ",".join(sorted(tool.name for tool in self.tools))
 
         #init agent
-        self.agent = initialize_agent(
-            tools=self.tools,
+        self.agent = self._create_agent()
+        self.agent_tool_count = len(self.tools)
+
+    def fork(self, session_id="default"):
+        """Create a new MCP with its own memory that shares the LLM, tools, worker pool and context store."""
+        session = MCP(
             llm=self.llm,
+            tools=self.tools,
+            executor=self.executor,
+            context_store=self.context_store,
+            session_id=session_id,
+            single_flight=self.single_flight,
+            context_index=self.context_index
+        )
+        session.sql_db = self.sql_db
+        return session
+
+    def _create_agent(self):
+        """Create the agent selected by MCP_AGENT_MODE."""
+        from langchain.agents import AgentExecutor, AgentType, create_tool_calling_agent, initialize_agent
+        # A copy of the shared LLM, so the tag doesn't reach the memory's and tools' calls
+        llm = self.llm.model_copy(update={"tags": (self.llm.tags or []) + [AGENT_LLM_TAG]})
+        if MCP_AGENT_MODE == "tool_calling":
+            from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", "You are a helpful assistant. When several independent lookups are needed, "
+                           "request all of the tool calls at once."),
+                MessagesPlaceholder("chat_history", optional=True),
+                ("human", "{input}"),
+                MessagesPlaceholder("agent_scratchpad"),
+            ])
+            # The async executor runs all tool calls of a step concurrently
+            return AgentExecutor(
+                agent=create_tool_calling_agent(llm, self.tools, prompt),
+                tools=self.tools,
+                memory=self.memory,
+                verbose=MCP_AGENT_VERBOSE,
+                handle_parsing_errors=True,
+                max_iterations=MCP_MAX_ITERATIONS,
+                max_execution_time=MCP_REQUEST_TIMEOUT,
+                early_stopping_method="force"
+            )
+        return initialize_agent(
+            tools=self.tools,
+            llm=llm,
             agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
             memory=self.memory,
-            verbose=True,
-            handle_parsing_errors=True
+            verbose=MCP_AGENT_VERBOSE,
+            handle_parsing_errors=True,
+            # Bound parsing-error retries and looping chains
+            max_iterations=MCP_MAX_ITERATIONS,
+            max_execution_time=MCP_REQUEST_TIMEOUT,
+            early_stopping_method="force"
         )
 
+    def _create_memory(self):
+        """Create the conversation memory selected by MCP_MEMORY_MODE."""
+        if MCP_MEMORY_MODE == "summary":
+            from conversation_memory import TokenBudgetMemory
+            return TokenBudgetMemory(
+                llm=self.llm,
+                memory_key="chat_history",
+                return_messages=True,
+                max_token_limit=MCP_MEMORY_TOKEN_BUDGET,
+                keep_last_n=MCP_MEMORY_KEEP_LAST
+            )
+        if MCP_MEMORY_MODE == "retrieval":
+            from conversation_memory import RetrievalMemory
+            return RetrievalMemory(
+                memory_key="chat_history",
+                return_messages=True,
+                k=MCP_MEMORY_KEEP_LAST,
+                index=self.context_index,
+                session_id=self.session_id,
+                top_k=MCP_RETRIEVAL_TOP_K
+            )
+        from langchain.memory import ConversationBufferMemory
+        return ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+
+    def _create_context_index(self):
+        """Create the full-text index of past exchanges used by MCP_MEMORY_MODE=retrieval."""
+        if MCP_MEMORY_MODE != "retrieval":
+            return None
+        try:
+            from context_search import ExchangeIndex
+            return ExchangeIndex()
+        except Exception as e:
+            # e.g. SQLite built without FTS5; fall back to the recent window only
+            logger.error(f"Failed to create context index: {str(e)}")
+            return None
+
+    def _create_context_store(self):
+        """Start the persistent context store selected by MCP_CONTEXT_STORE, if any."""
+        if MCP_CONTEXT_STORE != "postgres":
+            return None
+        try:
+            install_db_hooks()
+            from context_store import PostgresContextStore
+            store = PostgresContextStore(
+                batch_size=MCP_CONTEXT_BATCH_SIZE,
+                flush_interval=MCP_CONTEXT_FLUSH_INTERVAL
+            )
+            store.start()
+            return store
+        except Exception as e:
+            logger.error(f"Failed to start context store: {str(e)}")
+            return None
+
+    def restore_history(self, n=MCP_CONTEXT_RESTORE_LAST):
+        """Load the last n stored exchanges of this session into memory."""
+        if self.context_store is None or n <= 0:
+            return 0
+        try:
+            exchanges = self.context_store.get_last_n(self.session_id, n)
+        except Exception as e:
+            logger.error(f"Error restoring history for session {self.session_id}: {str(e)}")
+            return 0
+        self.replay_exchanges(exchanges)
+        return len(exchanges)
+
+    def replay_exchanges(self, exchanges):
+        """Add exchanges that are already persisted to memory and context, without storing them again."""
+        for exchange in exchanges:
+            self.memory.save_context({"input": exchange["user"]}, {"output": exchange["model"]})
+        self.context_manager.restore(exchanges)
+
+    def close(self):
+        """Flush and stop background workers."""
+        if self.context_store is not None:
+            self.context_store.close()
+        if self.mcp_server_pool is not None:
+            self.mcp_server_pool.close()
+        self.executor.shutdown(wait=False)
+
     def _initialize_tools(self):
-        """Initialize and combine all available tools"""
+        """Initialize and combine all available tools, bringing the toolkits up concurrently"""
+        initializers = [self._init_sql_toolkit, self._init_mcp_servers]
+        # Toolkits connect to external services, so overlap their startup
+        futures = [self.executor.submit(initializer) for initializer in initializers]
         tools = []
-        
-        #init GitHub toolkit if credentials are available
-        """if all([GITHUB_APP_ID, GITHUB_APP_PRIVATE_KEY, GITHUB_REPOSITORY]):
-            try:
-                logger.info("Initializing GitHub toolkit")
-                # Validate repository format
-                if '/' not in GITHUB_REPOSITORY:
-                    raise ValueError(f"GITHUB_REPOSITORY must be in format 'owner/repo', got: {GITHUB_REPOSITORY}")
-                
-                # Split repository into owner and repo
-                repo_parts = GITHUB_REPOSITORY.split('/')
-                if len(repo_parts) != 2:
-                    raise ValueError(f"GITHUB_REPOSITORY must have exactly one '/', got: {GITHUB_REPOSITORY}")
+        for future in futures:
+            tools.extend(future.result())
 
+        return self._limit_tools(tools)
 
-                github = GitHubAPIWrapper(
-                    github_app_id=GITHUB_APP_ID,
-                    github_app_private_key=GITHUB_APP_PRIVATE_KEY,
-                    github_repository=GITHUB_REPOSITORY
-                )
-                github_toolkit = GitHubToolkit.from_github_api_wrapper(github)
-                tools.extend(github_toolkit.get_tools())
-                logger.info("GitHub toolkit initialized successfully")
-            except Exception as e:
-                logger.error(f"Failed to initialize GitHub toolkit: {str(e)}")
-                logger.error(f"Check your GitHub configuration:")
-                logger.error(f"  GITHUB_APP_ID: {'Set' if GITHUB_APP_ID else 'Not set'}")
-                logger.error(f"  GITHUB_APP_PRIVATE_KEY: {'Set' if GITHUB_APP_PRIVATE_KEY else 'Not set'}")
-                logger.error(f"  GITHUB_REPOSITORY: {GITHUB_REPOSITORY}")
+    def _limit_tools(self, tools):
+        from tool_limits import parse_limits, limit_tools
+        concurrency = parse_limits(MCP_TOOL_CONCURRENCY)
+        timeouts = parse_limits(MCP_TOOL_TIMEOUTS)
+        if concurrency or timeouts:
+            tools = limit_tools(tools, concurrency, timeouts)
+        return tools
 
-        
-        #init GitLab toolkit if credentials are available
-        if all([GITLAB_URL, GITLAB_PERSONAL_ACCESS_TOKEN, GITLAB_REPOSITORY]):
+    def _add_tools(self, tools):
+        """Offer tools that became available after startup, e.g. from an MCP server that came up late.
+
+        Sessions share the tool list and rebuild their agent on their next turn.
+        """
+        self.tools.extend(self._limit_tools(tools))
+        if self.llm.cache is not None:
+            self.llm.cache.tool_set = ",".join(sorted(tool.name for tool in self.tools))
+        logger.info(f"Added {len(tools)} tools: {', '.join(tool.name for tool in tools)}")
+
+    def _current_agent(self):
+        """Return the agent, rebuilt first if tools were added since it was created."""
+        if self.agent_tool_count != len(self.tools):
+            self.agent_tool_count = len(self.tools)
+            self.agent = self._create_agent()
+        return self.agent
+
+    def _init_mcp_servers(self):
+        """Spawn the configured MCP servers once and load their tools"""
+        tools = []
+        if MCP_SERVERS_CONFIG:
             try:
-                logger.info("Initializing GitLab toolkit")
-                gitlab = GitLabAPIWrapper(
-                    gitlab_url=GITLAB_URL,
-                    gitlab_personal_access_token=GITLAB_PERSONAL_ACCESS_TOKEN,
-                    gitlab_repository=GITLAB_REPOSITORY,
-                    gitlab_branch=GITLAB_BRANCH,
-                    gitlab_base_branch=GITLAB_BASE_BRANCH
+                logger.info("Initializing MCP servers")
+                from mcp_servers import MCPServerPool, load_server_configs
+                pool = MCPServerPool(
+                    load_server_configs(MCP_SERVERS_CONFIG),
+                    pool_size=MCP_SERVER_POOL_SIZE,
+                    health_interval=MCP_SERVER_HEALTH_INTERVAL,
+                    on_tools_added=self._add_tools
                 )
-                gitlab_toolkit = GitLabToolkit.from_gitlab_api_wrapper(gitlab)
-                tools.extend(gitlab_toolkit.get_tools())
-                logger.info("GitLab toolkit initialized successfully")
+                pool.start()
+                self.mcp_server_pool = pool
+                tools.extend(pool.get_tools())
+                logger.info("MCP servers initialized successfully")
             except Exception as e:
-                logger.error(f"Failed to initialize GitLab toolkit: {str(e)}") """#"""
-        
-        #init SQL toolkit if credentials are available
+                logger.error(f"Failed to initialize MCP servers: {str(e)}")
+        return tools
+
+    def _init_sql_toolkit(self):
+        """Initialize the SQL toolkit if credentials are available"""
+        tools = []
         if all([POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_PORT, POSTGRES_DB]):
             try:
                 logger.info("Initializing SQL toolkit")
-                db_uri = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
-                db = SQLDatabase.from_uri(db_uri)
+                from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+                from sql_cache import CachedSQLDatabase
+                from database import get_engine
+                install_db_hooks()
+                # Share the pooled engine from database.py instead of opening a second one
+                db = CachedSQLDatabase(
+                    get_engine(),
+                    schema_ttl=MCP_SQL_SCHEMA_TTL,
+                    result_cache_size=MCP_SQL_RESULT_CACHE_SIZE,
+                    result_ttl=MCP_SQL_RESULT_TTL
+                )
+                if MCP_SQL_SCHEMA_PRELOAD:
+                    db.warm()
+                self.sql_db = db
                 sql_toolkit = SQLDatabaseToolkit(db=db, llm=self.llm)
                 tools.extend(sql_toolkit.get_tools())
                 logger.info("SQL toolkit initialized successfully")
@@ -152,57 +399,287 @@ class MCP:
         
         return tools
     
-    def interact(self, user_input):
-        """Process user input and return AI response."""
+    def _check_input(self, user_input):
+        """Handle inputs that don't need an agent run. Returns a reply or None."""
+        if user_input.lower() == "debug_sql":
+        # Direct tool testing
+            for tool in self.tools:
+                if tool.name == "sql_db_list_tables":
+                    print(f"Testing {tool.name} directly...")
+                    result = tool.run("")
+                    print(f"Direct result: '{result}'")
+                    return f"Direct tool result: {result}"
+
+        if not user_input.strip():
+            return "Error: Empty input. Please provide a valid query."
+
+        return None
+
+    def _extract_response_text(self, response):
+        """Pull the reply text out of an agent response."""
+        # Extract the actual response text from the dictionary
+        if isinstance(response, dict):
+            # Based on the response "AI: Hello! How can I assist you today?"
+            # it seems the response is in the 'output' key
+            response_text = response.get('output', '')
+            
+            # If 'output' isn't available, try other possible keys
+            if not response_text and 'response' in response:
+                response_text = response['response']
+            elif not response_text and 'content' in response:
+                response_text = response['content']
+            elif not response_text and 'result' in response:
+                response_text = response['result']
+            # Fallback: convert the whole response to string
+            elif not response_text:
+                response_text = str(response)
+        else:
+            response_text = str(response)
+        return response_text
+
+    def interact(self, user_input, use_cache=True, verbose=False):
+        """Process user input and return AI response.
+
+        Set use_cache=False to bypass the LLM response cache for this request,
+        and verbose=True to print the agent trace for it.
+        """
+        from llm_cache import bypass_cache
+        with bypass_cache(not use_cache), \
+                request_budget(MCP_REQUEST_TIMEOUT, MCP_MAX_REQUEST_TOKENS) as budget, \
+                request_trace("interact", self.session_id):
+            return self._interact(user_input, budget, verbose)
+
+    def _interact(self, user_input, budget, verbose):
         try:
-            if user_input.lower() == "debug_sql":
-            # Direct tool testing
-                for tool in self.tools:
-                    if tool.name == "sql_db_list_tables":
-                        print(f"Testing {tool.name} directly...")
-                        result = tool.run("")
-                        print(f"Direct result: '{result}'")
-                        return f"Direct tool result: {result}"
-                        
-            if not user_input.strip():
-                return "Error: Empty input. Please provide a valid query."
+            early_reply = self._check_input(user_input)
+            if early_reply is not None:
+                return early_reply
             
             # Run the agent with the user input
-            response = self.agent.invoke(user_input, chat_history=[])
-            
-            # Extract the actual response text from the dictionary
-            if isinstance(response, dict):
-                # Based on the response "AI: Hello! How can I assist you today?"
-                # it seems the response is in the 'output' key
-                response_text = response.get('output', '')
-                
-                # If 'output' isn't available, try other possible keys
-                if not response_text and 'response' in response:
-                    response_text = response['response']
-                elif not response_text and 'content' in response:
-                    response_text = response['content']
-                elif not response_text and 'result' in response:
-                    response_text = response['result']
-                # Fallback: convert the whole response to string
-                elif not response_text:
-                    response_text = str(response)
-            else:
-                response_text = str(response)
+            response = self._current_agent().invoke(user_input, config=self._run_config(budget, verbose), chat_history=[])
+            response_text = self._extract_response_text(response)
+            self._check_agent_stopped(response_text, budget)
             
             # Store interaction in custom context manager
             self.context_manager.add_context(user_input, response_text)
             
             return response_text
+        except BudgetExceeded as e:
+            budget.record(e.limit)
+            return f"Stopped: {str(e)}"
+        except Exception as e:
+            logger.error(f"Error during interaction: {str(e)}")
+            return f"Error: {str(e)}"
+
+    async def ainteract(self, user_input, use_cache=True, verbose=False):
+        """Async version of interact that never blocks the event loop."""
+        response_text, _ = await self.ainteract_with_limits(user_input, use_cache, verbose)
+        return response_text
+
+    async def ainteract_with_limits(self, user_input, use_cache=True, verbose=False):
+        """Like ainteract, but also return the list of request limits that were hit.
+
+        The request deadline cancels the agent run, including in-flight LLM
+        calls and Postgres statements. With MCP_COALESCE_REQUESTS, identical
+        concurrent requests over the same history share one run.
+        """
+        # Cache bypass asks for a fresh answer, so never share one
+        if not MCP_COALESCE_REQUESTS or not use_cache or not user_input.strip():
+            return await self._ainteract_with_limits(user_input, use_cache, verbose)
+
+        key = (normalize_input(user_input), context_fingerprint(self.memory, user_input))
+
+        async def run():
+            # Tell followers which session ran, so a retry from the same session is not recorded twice
+            return await self._ainteract_with_limits(user_input, use_cache, verbose), self
+
+        (result, runner), shared = await self.single_flight.run(key, run)
+        response_text = result[0]
+        if shared and runner is not self and not response_text.startswith(("Error:", "Stopped:")):
+            # The run happened in another session, so record the exchange in ours
+            await self.memory.asave_context({"input": user_input}, {"output": response_text})
+            self.context_manager.add_context(user_input, response_text)
+        return result
+
+    async def _ainteract_with_limits(self, user_input, use_cache, verbose):
+        with request_trace("interact", self.session_id):
+            return await self._ainteract_with_budget(user_input, use_cache, verbose)
+
+    async def _ainteract_with_budget(self, user_input, use_cache, verbose):
+        budget = RequestBudget(timeout=MCP_REQUEST_TIMEOUT, max_tokens=MCP_MAX_REQUEST_TOKENS)
+        token = current_budget.set(budget)
+        loop = asyncio.get_running_loop()
+        try:
+            if not MCP_ASYNC_AGENT or user_input.lower() == "debug_sql":
+                # Sync fallback: run the whole interaction on the bounded worker pool.
+                # The thread can't be cancelled, so the agent's max_execution_time bounds it.
+                response_text = await loop.run_in_executor(
+                    self.executor, copy_context().run, self.interact, user_input, use_cache, verbose
+                )
+            else:
+                from llm_cache import bypass_cache
+                with bypass_cache(not use_cache):
+                    response_text = await asyncio.wait_for(
+                        self._ainteract(user_input, budget, verbose), budget.remaining()
+                    )
+        except asyncio.TimeoutError:
+            budget.record("request_timeout")
+            response_text = f"Stopped: request deadline of {MCP_REQUEST_TIMEOUT}s exceeded"
+            await self._cancel_backends(budget)
+        finally:
+            current_budget.reset(token)
+        return response_text, budget.limits_hit
+
+    async def _cancel_backends(self, budget):
+        """Stop Postgres statements a timed-out request still has running in tool threads."""
+        if budget.backend_pids:
+            from database import cancel_backends
+            await asyncio.get_running_loop().run_in_executor(None, cancel_backends, set(budget.backend_pids))
+
+    async def _ainteract(self, user_input, budget, verbose):
+        try:
+            if not user_input.strip():
+                return "Error: Empty input. Please provide a valid query."
+
+            # Native async agent run; sync-only tools are dispatched to an executor by LangChain
+            response = await self._current_agent().ainvoke(user_input, config=self._run_config(budget, verbose), chat_history=[])
+            response_text = self._extract_response_text(response)
+            self._check_agent_stopped(response_text, budget)
+
+            self.context_manager.add_context(user_input, response_text)
+
+            return response_text
+        except BudgetExceeded as e:
+            budget.record(e.limit)
+            return f"Stopped: {str(e)}"
         except Exception as e:
             logger.error(f"Error during interaction: {str(e)}")
             return f"Error: {str(e)}"
+
+    def _run_config(self, budget, verbose=False):
+        """Callbacks enforcing the request budget and tracing an agent run."""
+        from callbacks import TokenBudgetCallback, TracingCallback
+        from langchain_core.callbacks import StdOutCallbackHandler
+        callbacks = [TokenBudgetCallback(budget)]
+        trace = current_trace.get()
+        if trace is not None:
+            callbacks.append(TracingCallback(trace))
+        if verbose or MCP_AGENT_VERBOSE:
+            callbacks.append(StdOutCallbackHandler())
+        return {"callbacks": callbacks}
+
+    def _check_agent_stopped(self, response_text, budget):
+        """Record the limit behind AgentExecutor's forced stop message."""
+        if response_text == AGENT_STOPPED_MESSAGE:
+            budget.record("request_timeout" if budget.expired() else "max_iterations")
+
+    async def astream_interact(self, user_input, verbose=False, use_cache=True):
+        """Run the agent and yield events as they happen.
+
+        Yields dicts with a "type" of "token", "tool_start", "tool_end",
+        "final" or "error". use_cache=False skips the LLM response cache.
+        """
+        if not user_input.strip():
+            yield {"type": "error", "error": "Empty input. Please provide a valid query."}
+            return
+
+        from llm_cache import bypass_cache
+        with bypass_cache(not use_cache):
+            async for event in self._astream_interact(user_input, verbose):
+                yield event
+
+    async def _astream_interact(self, user_input, verbose):
+        budget = RequestBudget(timeout=MCP_REQUEST_TIMEOUT, max_tokens=MCP_MAX_REQUEST_TOKENS)
+        token = current_budget.set(budget)
+        trace = RequestTrace("interact_stream", self.session_id)
+        trace_token = current_trace.set(trace)
+        try:
+            response_text = None
+            config = self._run_config(budget, verbose)
+            events = self._current_agent().astream_events(user_input, config=config, version="v2")
+            while True:
+                try:
+                    # Waiting on the next event under the deadline cancels a hung LLM call or tool
+                    event = await asyncio.wait_for(events.__anext__(), budget.remaining())
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    await self._cancel_backends(budget)
+                    raise BudgetExceeded("request_timeout", f"request deadline of {MCP_REQUEST_TIMEOUT}s exceeded")
+                kind = event["event"]
+                if kind == "on_chat_model_stream" and AGENT_LLM_TAG in event.get("tags", []):
+                    content = event["data"]["chunk"].content
+                    if content:
+                        yield {"type": "token", "content": content}
+                elif kind == "on_tool_start":
+                    yield {"type": "tool_start", "tool": event["name"], "input": str(event["data"].get("input", ""))}
+                elif kind == "on_tool_end":
+                    yield {"type": "tool_end", "tool": event["name"], "output": str(event["data"].get("output", ""))}
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    # End of the top-level agent run
+                    response_text = self._extract_response_text(event["data"].get("output"))
+
+            if response_text is None:
+                response_text = ""
+            self._check_agent_stopped(response_text, budget)
+            self.context_manager.add_context(user_input, response_text)
+            yield {"type": "final", "response": response_text, "limits_hit": budget.limits_hit}
+        except BudgetExceeded as e:
+            budget.record(e.limit)
+            yield {"type": "error", "error": f"Stopped: {str(e)}", "limits_hit": budget.limits_hit}
+        except Exception as e:
+            logger.error(f"Error during streaming interaction: {str(e)}")
+            yield {"type": "error", "error": str(e)}
+        finally:
+            current_trace.reset(trace_token)
+            current_budget.reset(token)
+            log_trace(trace)
         
     
+    def clear_context(self):
+        """Clear the conversation memory and the context manager."""
+        self.memory.clear()
+        self.context_manager.clear_context()
+        # Append logs need a clear marker on their next save
+        for state in self.memory_logs.values():
+            state["cleared"] = True
+
+    def export_state(self):
+        """Return the session's memory and context as JSON-serializable data."""
+        from langchain_core.messages import messages_to_dict
+        return {
+            "messages": messages_to_dict(self.memory.chat_memory.messages),
+            "summary": getattr(self.memory, "moving_summary_buffer", ""),
+            # Bounded so saving and reloading a session stay O(1) per turn
+            "context": self.context_manager.get_last_n_exchanges(MCP_CONTEXT_RESTORE_LAST),
+            "metadata": self.context_manager.metadata
+        }
+
+    def import_state(self, state):
+        """Replace the session's memory with data from export_state and catch up its context."""
+        from langchain_core.messages import messages_from_dict
+        self.memory.clear()
+        self.memory.chat_memory.add_messages(messages_from_dict(state.get("messages", [])))
+        if hasattr(self.memory, "moving_summary_buffer"):
+            self.memory.moving_summary_buffer = state.get("summary", "")
+        if MCP_CONTEXT_RESTORE_LAST > 0:
+            # With no exchanges shared, the context stays local to each worker
+            self.context_manager.merge(state.get("context", []), state.get("metadata"))
+        # Append logs need a clear marker on their next save
+        for log_state in self.memory_logs.values():
+            log_state["cleared"] = True
+
     def save_context(self, filename="context.json"):
+        """Save the conversation memory. A .jsonl filename appends only new messages."""
+        if filename.endswith(".jsonl"):
+            return self._append_memory_log(filename)
         try:
             memory_data = {
                 "chat_history": [{"role": msg.type, "content": msg.content} for msg in self.memory.chat_memory.messages]
             }
+            # Keep the rolling summary of a token-budgeted memory
+            if getattr(self.memory, "moving_summary_buffer", ""):
+                memory_data["summary"] = self.memory.moving_summary_buffer
             
             with open(filename, "w") as f:
                 json.dump(memory_data, f, indent=2)
@@ -213,18 +690,89 @@ class MCP:
             logger.error(f"Error saving context: {str(e)}")
             return f"Error saving context: {str(e)}"
 
-    def load_context(self, filename="context.json"):
+    def _get_memory_log(self, filename):
+        if filename not in self.memory_logs:
+            self.memory_logs[filename] = {
+                "log": AppendLog(filename, compact_every=MCP_CONTEXT_COMPACT_EVERY),
+                # Last message object written; everything after it is new
+                "last": None,
+                "summary": "",
+                "cleared": False,
+            }
+        return self.memory_logs[filename]
+
+    def _append_memory_log(self, filename):
+        try:
+            state = self._get_memory_log(filename)
+            messages = self.memory.chat_memory.messages
+            records = []
+            if state["cleared"]:
+                records.append({"type": CLEAR})
+                state["last"] = None
+                state["summary"] = ""
+
+            # If the last written message was pruned into the summary, every remaining message is newer
+            start = 0
+            if state["last"] is not None:
+                for i in range(len(messages) - 1, -1, -1):
+                    if messages[i] is state["last"]:
+                        start = i + 1
+                        break
+            records.extend({"type": "message", "role": msg.type, "content": msg.content} for msg in messages[start:])
+
+            summary = getattr(self.memory, "moving_summary_buffer", "")
+            if summary != state["summary"]:
+                # Only the buffered messages, written right before this record, are not in the summary
+                records.append({"type": SUMMARY, "content": summary, "kept": len(messages)})
+
+            state["log"].append(records)
+            state["last"] = messages[-1] if messages else None
+            state["summary"] = summary
+            state["cleared"] = False
+
+            logger.info(f"Appended {len(records)} records to {filename}")
+            return f"Context saved to {filename}"
+        except Exception as e:
+            logger.error(f"Error saving context: {str(e)}")
+            return f"Error saving context: {str(e)}"
+
+    def load_context(self, filename="context.json", last_n=None):
+        """Load saved conversation memory.
+
+        For a .jsonl log, last_n loads only the most recent exchanges.
+        """
         try:
-            with open(filename, "r") as f:
-                data = json.load(f)
+            summary = None
+            if filename.endswith(".jsonl"):
+                state = self._get_memory_log(filename)
+                # Messages already folded into the summary are skipped
+                chat_history, summary_record = state["log"].tail(
+                    None if last_n is None else 2 * last_n, "message",
+                    with_summary=last_n is None or hasattr(self.memory, "moving_summary_buffer")
+                )
+                summary = summary_record["content"] if summary_record else ""
+            else:
+                with open(filename, "r") as f:
+                    data = json.load(f)
+                chat_history = data.get("chat_history", [])
+                summary = data.get("summary", "")
 
             self.memory.clear()
             from langchain.schema import HumanMessage, AIMessage
-            for msg in data.get("chat_history", []):
+            for msg in chat_history:
                 if msg["role"] == "human":
                     self.memory.chat_memory.add_message(HumanMessage(content=msg["content"]))
                 elif msg["role"] == "ai":
                     self.memory.chat_memory.add_message(AIMessage(content=msg["content"]))
+            if hasattr(self.memory, "moving_summary_buffer"):
+                self.memory.moving_summary_buffer = summary
+
+            if filename.endswith(".jsonl"):
+                # Everything loaded is already in the log
+                messages = self.memory.chat_memory.messages
+                state["last"] = messages[-1] if messages else None
+                state["summary"] = summary
+                state["cleared"] = False
             logger.info(f"Context loaded from {filename}")
             return f"Context loaded from {filename}"
         except FileNotFoundError:
@@ -235,6 +783,26 @@ class MCP:
             return f"Error loading context: {str(e)}"
         
     
+    def get_cache_stats(self):
+        """Return LLM response cache counters, or None if caching is disabled."""
+        from llm_cache import ResponseCache
+        if not isinstance(self.llm.cache, ResponseCache):
+            return None
+        return self.llm.cache.get_stats()
+
+    def get_sql_cache_stats(self):
+        """Return SQL schema and query result cache counters, or None without a SQL toolkit."""
+        if self.sql_db is None:
+            return None
+        return self.sql_db.get_cache_stats()
+
+    def invalidate_schema_cache(self, table_names=None):
+        """Drop cached SQL schema info for the given tables, or all of them."""
+        if self.sql_db is None:
+            return False
+        self.sql_db.invalidate(table_names)
+        return True
+
     def get_available_tools(self):
         """Return a list of available tools for the user."""
         tool_descriptions = []
@@ -250,23 +818,27 @@ class MCP:
         """Test database connection and show basic info"""
         try:
             # Test the connection
-            db_uri = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
             print(f"Testing connection to: postgresql://{POSTGRES_USER}:***@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")
             
-            from langchain_community.utilities.sql_database import SQLDatabase
-            db = SQLDatabase.from_uri(db_uri)
+            # Reuse the toolkit's database, or query the shared engine directly without reflecting it
+            from database import get_engine, get_pool_stats
+            from sqlalchemy import inspect, text
+            install_db_hooks()
+            engine = get_engine()
             
             # Try to get table info
-            tables = db.get_usable_table_names()
+            tables = self.sql_db.get_usable_table_names() if self.sql_db is not None else inspect(engine).get_table_names()
             print(f"Connected successfully!")
             print(f"Found {len(tables)} tables: {tables}")
             
             # Try a simple query
             if tables:
-                result = db.run("SELECT current_database(), current_user;")
-                print(f"Database info: {result}")
+                with engine.connect() as connection:
+                    result = connection.execute(text("SELECT current_database(), current_user")).first()
+                print(f"Database info: {tuple(result)}")
             else:
                 print("No tables found - database might be empty")
+            print(f"Connection pool: {get_pool_stats()}")
                 
             return True
             
@@ -286,8 +858,7 @@ if __name__ == "__main__":
             print("Exiting...")
             break
         elif user_input.lower() == "clear":
-            mcp.memory.clear()
-            mcp.context_manager.clear_context()           
+            mcp.clear_context()
             print("Context cleared.")
             continue
         elif user_input.lower() == "save":
@@ -0,0 +1,290 @@
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from langchain_core.tools import StructuredTool
+import asyncio
+import itertools
+import json
+import threading
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def load_server_configs(path):
+    """Read MCP server definitions from a JSON file.
+
+    Accepts {"mcpServers": {...}} or {"servers": {...}}, where each entry has
+    "command" and optional "args", "env" and "cwd".
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+    servers = data.get("mcpServers", data.get("servers", {}))
+    return {
+        name: StdioServerParameters(
+            command=config["command"],
+            args=config.get("args", []),
+            env=config.get("env"),
+            cwd=config.get("cwd"),
+        )
+        for name, config in servers.items()
+    }
+
+
+class MCPServerConnection:
+    """One live stdio subprocess with an initialized ClientSession.
+
+    The session lives inside a single long-running task because the stdio
+    client's task group must be entered and exited by the same task.
+    """
+
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+        self.session = None
+        self.healthy = False
+        self.restarts = 0
+        self._task = None
+        # In-flight restart, shared by every caller that asks for one
+        self._restart_task = None
+        self._ready = None
+        self._stop = None
+
+    async def start(self, timeout=30):
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        await asyncio.wait_for(self._ready.wait(), timeout)
+        if self.session is None:
+            # _run failed before the session came up
+            await self._task
+        self.healthy = True
+
+    async def _run(self):
+        try:
+            async with stdio_client(self.params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._stop.wait()
+        finally:
+            self.session = None
+            self.healthy = False
+            self._ready.set()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(self._task, 10)
+        except Exception as e:
+            logger.warning(f"Error stopping MCP server {self.name}: {str(e)}")
+        self._task = None
+
+    def schedule_restart(self):
+        """Start a restart unless one is already running, and return its task."""
+        if self._restart_task is None or self._restart_task.done():
+            self.healthy = False
+            self._restart_task = asyncio.create_task(self._restart())
+            self._restart_task.add_done_callback(self._restart_done)
+        return self._restart_task
+
+    async def _restart(self):
+        await self.stop()
+        self.restarts += 1
+        await self.start()
+        logger.info(f"Restarted MCP server {self.name} (restart #{self.restarts})")
+
+    def _restart_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to restart MCP server {self.name}: {str(task.exception())}")
+
+    async def ping(self):
+        if self.session is None:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), 5)
+            return True
+        except Exception:
+            return False
+
+
+class MCPServerPool:
+    """Pool of long-lived MCP server sessions shared across requests.
+
+    Subprocesses are spawned once and owned by a dedicated event loop
+    thread, so tools can be called from the request loop and from worker
+    threads alike. Failed sessions are restarted by a periodic health check
+    or when a call on them fails.
+
+    Tools of a server that was down at startup are loaded once it comes up
+    and passed to `on_tools_added`.
+    """
+
+    def __init__(self, configs, pool_size=1, health_interval=30, call_timeout=60, on_tools_added=None):
+        self.configs = configs
+        self.on_tools_added = on_tools_added
+        # Servers whose tools have been loaded
+        self._listed = set()
+        self.pool_size = pool_size
+        self.health_interval = health_interval
+        self.call_timeout = call_timeout
+        # server name -> list of connections
+        self.connections = {}
+        self._round_robin = {}
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="mcp-server-pool", daemon=True)
+        self._health_task = None
+
+    def start(self):
+        """Spawn every configured server and wait until they are initialized."""
+        self._thread.start()
+        self._submit(self._start_all()).result()
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _start_all(self):
+        for name, params in self.configs.items():
+            self.connections[name] = [MCPServerConnection(name, params) for _ in range(self.pool_size)]
+            self._round_robin[name] = itertools.cycle(range(self.pool_size))
+        connections = [conn for conns in self.connections.values() for conn in conns]
+        results = await asyncio.gather(*(conn.start() for conn in connections), return_exceptions=True)
+        for conn, result in zip(connections, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to start MCP server {conn.name}: {str(result)}")
+        if self.health_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for conns in self.connections.values():
+                for conn in conns:
+                    if not await conn.ping():
+                        logger.warning(f"MCP server {conn.name} failed health check, restarting")
+                        # Joins a restart already started by a failed call; failures are logged by the task
+                        await asyncio.wait([conn.schedule_restart()])
+            await self._load_late_tools()
+
+    async def _load_late_tools(self):
+        """Load the tools of servers that were down when get_tools() ran."""
+        if self.on_tools_added is None or len(self._listed) == len(self.connections):
+            return
+        try:
+            tools = await self._list_tools()
+        except Exception as e:
+            logger.error(f"Error loading tools of restarted MCP servers: {str(e)}")
+            return
+        if tools:
+            try:
+                self.on_tools_added(tools)
+            except Exception as e:
+                logger.error(f"Error adding tools of restarted MCP servers: {str(e)}")
+
+    def _pick(self, server):
+        conns = self.connections[server]
+        for _ in range(len(conns)):
+            conn = conns[next(self._round_robin[server])]
+            if conn.healthy and conn.session is not None:
+                return conn
+        return None
+
+    async def _call_tool(self, server, tool_name, arguments):
+        for attempt in range(2):
+            conn = self._pick(server)
+            if conn is None:
+                raise RuntimeError(f"No healthy session for MCP server {server}")
+            try:
+                return await asyncio.wait_for(conn.session.call_tool(tool_name, arguments), self.call_timeout)
+            except asyncio.TimeoutError:
+                raise
+            except Exception as e:
+                logger.warning(f"MCP server {server} call failed ({str(e)}), restarting session")
+                restart = conn.schedule_restart()
+                if attempt == 1:
+                    raise
+                if not self._has_healthy(server):
+                    # No other session to retry on; failures are logged by the task
+                    await asyncio.wait([restart])
+
+    def _has_healthy(self, server):
+        return any(conn.healthy and conn.session is not None for conn in self.connections[server])
+
+    def call_tool(self, server, tool_name, arguments):
+        """Call a tool from any thread and wait for its text result."""
+        result = self._submit(self._call_tool(server, tool_name, arguments)).result()
+        return _result_to_text(result)
+
+    async def acall_tool(self, server, tool_name, arguments):
+        """Call a tool from any event loop."""
+        result = await asyncio.wrap_future(self._submit(self._call_tool(server, tool_name, arguments)))
+        return _result_to_text(result)
+
+    def get_tools(self):
+        """Return LangChain tools for every tool exposed by the pooled servers."""
+        return self._submit(self._list_tools()).result()
+
+    async def _list_tools(self):
+        tools = []
+        for server in self.connections:
+            if server in self._listed:
+                continue
+            conn = self._pick(server)
+            if conn is None:
+                continue
+            listed = await conn.session.list_tools()
+            for tool in listed.tools:
+                tools.append(self._make_tool(server, tool))
+            self._listed.add(server)
+            logger.info(f"Loaded {len(listed.tools)} tools from MCP server {server}")
+        return tools
+
+    def _make_tool(self, server, tool):
+        name = tool.name
+
+        def run(**kwargs):
+            return self.call_tool(server, name, kwargs)
+
+        async def arun(**kwargs):
+            return await self.acall_tool(server, name, kwargs)
+
+        return StructuredTool(
+            name=name,
+            description=tool.description or "",
+            args_schema=tool.inputSchema,
+            func=run,
+            coroutine=arun,
+        )
+
+    def get_status(self):
+        """Return health and restart counts of every pooled session."""
+        return {
+            server: [{"healthy": conn.healthy, "restarts": conn.restarts} for conn in conns]
+            for server, conns in self.connections.items()
+        }
+
+    def close(self):
+        """Stop every server subprocess and the pool's event loop."""
+        async def _close_all():
+            if self._health_task is not None:
+                self._health_task.cancel()
+            restarts = [conn._restart_task for conns in self.connections.values() for conn in conns
+                        if conn._restart_task is not None and not conn._restart_task.done()]
+            if restarts:
+                await asyncio.wait(restarts, timeout=30)
+            await asyncio.gather(*(conn.stop() for conns in self.connections.values() for conn in conns))
+
+        if self._thread.is_alive():
+            self._submit(_close_all()).result(timeout=30)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def _result_to_text(result):
+    text = "\n".join(item.text for item in result.content if getattr(item, "type", None) == "text")
+    if result.isError:
+        return f"Error: {text}"
+    return text
@@ -0,0 +1,139 @@
+import threading
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in self.values.items()]
+
+
+class Histogram:
+    """Cumulative histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [bucket counts..., sum, count]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self.lock:
+            entry = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for key, entry in self.values.items():
+                for bound, count in zip(self.buckets, entry):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {entry[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {entry[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {entry[-1]}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, callback):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+
+    def render(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} failed: {str(e)}")
+            return []
+        return [] if value is None else [f"{self.name} {value}"]
+
+
+class CallbackCounter(Gauge):
+    """Monotonic total kept elsewhere and read from a callback at scrape time."""
+
+    kind = "counter"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def gauge(self, name, help_text, callback):
+        """Register (or replace) a callback gauge."""
+        return self.register(Gauge(name, help_text, callback))
+
+    def counter(self, name, help_text, callback):
+        """Register (or replace) a callback counter; name should end in _total."""
+        return self.register(CallbackCounter(name, help_text, callback))
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter("mcp_requests_total", "HTTP requests handled", ["endpoint", "status"]))
+REQUEST_DURATION = REGISTRY.register(Histogram("mcp_request_duration_seconds", "End-to-end request latency", ["endpoint"]))
+QUEUE_WAIT = REGISTRY.register(Histogram("mcp_queue_wait_seconds", "Time spent waiting for admission"))
+LIMITS_HIT = REGISTRY.register(Counter("mcp_request_limits_hit_total", "Request limits that stopped or shortened a run", ["limit"]))
+LLM_CALLS = REGISTRY.register(Counter("mcp_llm_calls_total", "LLM calls", ["status"]))
+LLM_DURATION = REGISTRY.register(Histogram("mcp_llm_duration_seconds", "LLM call latency"))
+LLM_TOKENS = REGISTRY.register(Counter("mcp_llm_tokens_total", "LLM tokens used", ["kind"]))
+TOOL_CALLS = REGISTRY.register(Counter("mcp_tool_calls_total", "Tool invocations", ["tool", "status"]))
+TOOL_DURATION = REGISTRY.register(Histogram("mcp_tool_duration_seconds", "Tool invocation latency", ["tool"]))
+DB_QUERY_DURATION = REGISTRY.register(Histogram("mcp_db_query_duration_seconds", "Database statement latency"))
@@ -1,15 +1,35 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from typing import List, Optional
 from main import MCP
+from session_manager import SessionManager, DEFAULT_SESSION_ID
+from admission import AdmissionController, AdmissionRejected
+from metrics import REGISTRY, REQUESTS, REQUEST_DURATION
+from tracing import request_trace
+import asyncio
+import json
 import logging
+import os
+import time
+import uuid
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="MCP API", description="API for Model Context Protocol with LangChain")
-mcp = MCP()
+# Built in the background at startup so the server accepts traffic right away; see /ready
+mcp = None
+sessions = None
+startup_task = None
+startup_error = None
+# Bounds concurrent agent runs; see admission.py for the MCP_MAX_IN_FLIGHT/MCP_MAX_QUEUE settings
+admission = AdmissionController()
+MCP_BATCH_MAX_ITEMS = int(os.getenv("MCP_BATCH_MAX_ITEMS", "10000"))
+SESSION_NOT_SAVED = "Session was changed concurrently and this turn could not be saved; retry the request"
 
 # Add CORS middleware
 app.add_middleware(
@@ -18,68 +38,384 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets browser clients read the session id minted for them
+    expose_headers=["X-Session-ID"],
 )
 
 class UserInput(BaseModel):
     text: str
+    session_id: Optional[str] = None
+    # Set to false to skip the LLM response cache for this request
+    use_cache: bool = True
+    # Print the agent trace of this request to stdout
+    verbose: bool = False
+
+class BatchInput(BaseModel):
+    # Items without a session_id run on a fresh, throwaway session
+    items: List[UserInput]
+    concurrency: int = 4
+
+class SchemaInvalidation(BaseModel):
+    # None invalidates every table
+    tables: Optional[List[str]] = None
 
 class ContextOperation(BaseModel):
+    # A .jsonl filename uses the append-only log format
     filename: str = "context.json"
+    session_id: Optional[str] = None
+    # Load only the most recent exchanges of a .jsonl log
+    last_n: Optional[int] = None
+
+def resolve_session_id(body_session_id, header_session_id):
+    """Pick the session id from the request body, falling back to the X-Session-ID header."""
+    return body_session_id or header_session_id
+
+def conversation_session_id(body_session_id, header_session_id):
+    """Like resolve_session_id, but give a request without one a fresh session.
+
+    Anonymous clients would otherwise share (and mix up) one history. The id
+    is returned in the X-Session-ID header so the client can continue.
+    """
+    return resolve_session_id(body_session_id, header_session_id) or uuid.uuid4().hex
+
+def build_mcp():
+    from session_state import create_session_state
+    base = MCP()
+    # MCP_SESSION_STATE=sqlite/postgres lets several workers serve the same sessions
+    return base, SessionManager(base, state=create_session_state())
+
+async def initialize():
+    """Build the MCP (toolkits, DB connections) off the event loop."""
+    global mcp, sessions, startup_error
+    try:
+        loop = asyncio.get_running_loop()
+        mcp, sessions = await loop.run_in_executor(None, build_mcp)
+        logger.info("MCP is ready")
+    except Exception as e:
+        startup_error = str(e)
+        logger.error(f"MCP startup failed: {str(e)}")
+
+async def get_mcp():
+    """Wait for startup to finish and return the base MCP."""
+    if mcp is None and startup_task is not None:
+        await asyncio.shield(startup_task)
+    if mcp is None:
+        raise HTTPException(status_code=503, detail=f"MCP is not ready: {startup_error or 'starting'}")
+    return mcp
+
+async def get_sessions():
+    """Wait for startup to finish and return the session registry."""
+    await get_mcp()
+    return sessions
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count requests and record their latency per route."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        # Label by route template, not raw path, to keep label cardinality bounded
+        endpoint = getattr(route, "path", "unmatched")
+        REQUESTS.inc(endpoint=endpoint, status=str(status))
+        REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=endpoint)
+
+def register_gauges():
+    """Expose admission, session and cache state as gauges and counters read at scrape time."""
+    def pool_checked_out():
+        from database import get_pool_stats
+        return (get_pool_stats() or {}).get("checked_out")
+
+    REGISTRY.gauge("mcp_in_flight_requests", "Admitted requests currently running", lambda: admission.in_flight)
+    REGISTRY.gauge("mcp_queued_requests", "Requests waiting for admission", lambda: admission.queued)
+    REGISTRY.counter("mcp_admission_rejected_total", "Requests rejected by admission control", lambda: admission.rejected)
+    REGISTRY.gauge("mcp_sessions", "Live sessions", lambda: len(sessions) if sessions is not None else None)
+    REGISTRY.counter("mcp_llm_cache_hits_total", "LLM response cache hits",
+                     lambda: (mcp.get_cache_stats() or {}).get("hits") if mcp is not None else None)
+    REGISTRY.counter("mcp_llm_cache_misses_total", "LLM response cache misses",
+                     lambda: (mcp.get_cache_stats() or {}).get("misses") if mcp is not None else None)
+    REGISTRY.counter("mcp_coalesced_requests_total", "Requests that shared another request's agent run",
+                     lambda: mcp.single_flight.coalesced if mcp is not None else None)
+    REGISTRY.gauge("mcp_db_pool_checked_out", "Database connections in use",
+                   pool_checked_out)
+
+register_gauges()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def startup():
+    global startup_task
+    startup_task = asyncio.create_task(initialize())
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Flush queued context history and stop background workers."""
+    if mcp is not None:
+        mcp.close()
 
 @app.get("/")
 async def root():
     """Root endpoint to check if the API is running."""
     return {"message": "MCP API is running", "status": "online"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness endpoint: 200 once the MCP and its toolkits are initialized."""
+    if mcp is not None:
+        status = {"status": "ready", "tools": len(mcp.tools)}
+        if mcp.mcp_server_pool is not None:
+            status["mcp_servers"] = mcp.mcp_server_pool.get_status()
+        return status
+    if startup_error is not None:
+        raise HTTPException(status_code=503, detail=f"Startup failed: {startup_error}")
+    raise HTTPException(status_code=503, detail="Starting")
+
+async def admit(session_id):
+    """Wait for an admission slot, or reject with 429/503 and a Retry-After header."""
+    try:
+        return await admission.acquire(session_id or DEFAULT_SESSION_ID)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
 @app.post("/interact")
-async def interact(user_input: UserInput):
+async def interact(user_input: UserInput, response: Response, x_session_id: Optional[str] = Header(None)):
     """Process user input and return AI response."""
+    session_registry = await get_sessions()
+    session_id = conversation_session_id(user_input.session_id, x_session_id)
+    response.headers["X-Session-ID"] = session_id
+    with request_trace("interact", session_id) as trace:
+        trace.queue_wait = await admit(session_id)
+        start = time.monotonic()
+        try:
+            if not user_input.text.strip():
+                raise HTTPException(status_code=400, detail="Empty input. Please provide a valid query.")
+            
+            session = await session_registry.aget(session_id)
+            response_text, limits_hit = await session.ainteract_with_limits(
+                user_input.text, use_cache=user_input.use_cache, verbose=user_input.verbose
+            )
+            if not await session_registry.acommit(session_id, session):
+                raise HTTPException(status_code=409, detail=SESSION_NOT_SAVED)
+            # limits_hit names any request limit that cut the run short
+            return {"response": response_text, "limits_hit": limits_hit, "session_id": session_id}
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error in /interact endpoint: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            admission.release(time.monotonic() - start)
+
+@app.post("/interact/stream")
+async def interact_stream(user_input: UserInput, x_session_id: Optional[str] = Header(None)):
+    """Process user input and stream tokens and tool events as Server-Sent Events."""
+    if not user_input.text.strip():
+        raise HTTPException(status_code=400, detail="Empty input. Please provide a valid query.")
+
+    session_id = conversation_session_id(user_input.session_id, x_session_id)
+    session_registry = await get_sessions()
+    session = await session_registry.aget(session_id)
+    await admit(session_id)
+    start = time.monotonic()
+    released = False
+
+    def release():
+        # Called by the stream and by the background task; only the first call counts
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(time.monotonic() - start)
+
+    async def event_stream():
+        # The admission slot is held until the stream finishes
+        try:
+            async for event in session.astream_interact(
+                user_input.text, verbose=user_input.verbose, use_cache=user_input.use_cache
+            ):
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            if not await session_registry.acommit(session_id, session):
+                # The status line is already sent; report it as a final event
+                event = {"type": "error", "error": SESSION_NOT_SAVED}
+                yield f"event: error\ndata: {json.dumps(event)}\n\n"
+        finally:
+            release()
+
     try:
-        if not user_input.text.strip():
-            raise HTTPException(status_code=400, detail="Empty input. Please provide a valid query.")
-        
-        response = mcp.interact(user_input.text)
-        return {"response": response}
-    except Exception as e:
-        logger.error(f"Error in /interact endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        # The background task also runs when the client disconnects before the stream starts
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-ID": session_id},
+            background=BackgroundTask(release)
+        )
+    except Exception:
+        release()
+        raise
+
+@app.post("/interact/batch")
+async def interact_batch(batch: BatchInput):
+    """Run many independent inputs with bounded parallelism and stream results as NDJSON.
+
+    Lines arrive in completion order and carry the item's index. A failing
+    item reports its error without stopping the batch.
+    """
+    if len(batch.items) > MCP_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MCP_BATCH_MAX_ITEMS} items")
+    base = await get_mcp()
+    session_registry = await get_sessions()
+    batch_id = uuid.uuid4().hex
+    # Items share one admission queue; keep the workers within its per-session queue limit
+    concurrency = max(1, min(batch.concurrency, admission.max_queued_per_session))
+    # Items of the same session share its memory, so they run one at a time, in order
+    session_locks = {item.session_id: asyncio.Lock() for item in batch.items if item.session_id}
+
+    async def run_item(index, item):
+        result = {"index": index, "session_id": item.session_id}
+        forked = None
+        try:
+            if not item.text.strip():
+                raise ValueError("Empty input. Please provide a valid query.")
+            if item.session_id:
+                async with session_locks[item.session_id]:
+                    session = await session_registry.aget(item.session_id)
+                    response, limits_hit = await run_turn(session, item)
+                    saved = await session_registry.acommit(item.session_id, session)
+            else:
+                session = forked = base.fork(f"batch-{batch_id}-{index}")
+                response, limits_hit = await run_turn(session, item)
+                saved = True
+            result.update({"response": response, "limits_hit": limits_hit})
+            if not saved:
+                result["error"] = SESSION_NOT_SAVED
+        except AdmissionRejected as e:
+            result["error"] = e.detail
+        except Exception as e:
+            logger.error(f"Error in batch item {index}: {str(e)}")
+            result["error"] = str(e)
+        finally:
+            # One-off sessions are not registered anywhere; drop their indexed exchanges
+            if forked is not None:
+                forked.context_manager.release()
+        return result
+
+    async def run_turn(session, item):
+        async with admission.slot(f"batch-{batch_id}"):
+            return await session.ainteract_with_limits(item.text, use_cache=item.use_cache, verbose=item.verbose)
+
+    async def result_stream():
+        pending = iter(enumerate(batch.items))
+        results = asyncio.Queue()
+
+        async def worker():
+            for index, item in pending:
+                await results.put(await run_item(index, item))
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            for _ in range(len(batch.items)):
+                yield json.dumps(await results.get()) + "\n"
+        finally:
+            # Stop the workers if the client goes away
+            for task in workers:
+                task.cancel()
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@app.get("/admission")
+async def admission_stats():
+    """Get in-flight, queued and rejected request counts."""
+    return admission.get_stats()
 
 @app.get("/tools")
 async def get_tools():
     """Get available tools."""
+    base = await get_mcp()
     try:
-        tools = mcp.get_available_tools()
+        tools = base.get_available_tools()
         return {"tools": tools}
     except Exception as e:
         logger.error(f"Error in /tools endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Get LLM response cache hit/miss counters and SQL cache stats."""
+    base = await get_mcp()
+    stats = base.get_cache_stats()
+    llm_stats = {"enabled": False} if stats is None else {"enabled": True, **stats}
+    sql_stats = base.get_sql_cache_stats()
+    return {**llm_stats, "sql": sql_stats}
+
+@app.get("/db/pool")
+async def db_pool():
+    """Get usage and wait time of the shared database connection pool."""
+    from database import get_pool_stats
+    stats = get_pool_stats()
+    if stats is None:
+        return {"initialized": False}
+    return {"initialized": True, **stats}
+
+@app.post("/admin/schema/invalidate")
+async def invalidate_schema(invalidation: SchemaInvalidation):
+    """Drop cached SQL schema info so the next lookup re-reads the catalog."""
+    base = await get_mcp()
+    try:
+        # A full invalidation re-reflects the catalog, so keep it off the event loop
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(base.executor, base.invalidate_schema_cache, invalidation.tables):
+            raise HTTPException(status_code=404, detail="SQL toolkit is not configured")
+        return {"message": "Schema cache invalidated", "tables": invalidation.tables}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in /admin/schema/invalidate endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/context/save")
-async def save_context(operation: ContextOperation):
+async def save_context(operation: ContextOperation, x_session_id: Optional[str] = Header(None)):
     """Save the current conversation context."""
+    session_registry = await get_sessions()
     try:
-        result = mcp.save_context(operation.filename)
+        session = await session_registry.aget(resolve_session_id(operation.session_id, x_session_id))
+        # File I/O runs on the worker pool so it never blocks the event loop
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(session.executor, session.save_context, operation.filename)
         return {"message": result}
     except Exception as e:
         logger.error(f"Error in /context/save endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/context/load")
-async def load_context(operation: ContextOperation):
+async def load_context(operation: ContextOperation, x_session_id: Optional[str] = Header(None)):
     """Load a saved conversation context."""
+    session_registry = await get_sessions()
     try:
-        result = mcp.load_context(operation.filename)
+        session_id = resolve_session_id(operation.session_id, x_session_id)
+        session = await session_registry.aget(session_id)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(session.executor, session.load_context, operation.filename, operation.last_n)
+        await session_registry.acommit(session_id, session)
         return {"message": result}
     except Exception as e:
         logger.error(f"Error in /context/load endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/context/clear")
-async def clear_context():
-    """Clear the current conversation context."""
+async def clear_context(x_session_id: Optional[str] = Header(None)):
+    """Clear the conversation context of the calling session."""
+    session_registry = await get_sessions()
     try:
-        mcp.memory.clear()
-        mcp.context_manager.clear_context()
+        session = await session_registry.aget(x_session_id)
+        session.clear_context()
+        await session_registry.acommit(x_session_id, session)
         return {"message": "Context cleared successfully"}
     except Exception as e:
         logger.error(f"Error in /context/clear endpoint: {str(e)}")
@@ -87,4 +423,9 @@ async def clear_context():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    workers = int(os.getenv("MCP_WORKERS", "1"))
+    if workers > 1:
+        # Each worker keeps its own sessions unless MCP_SESSION_STATE is sqlite or postgres
+        uvicorn.run("server:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+from session_state import InProcessSessionState, StateConflict
+import asyncio
+import os
+import threading
+import time
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+DEFAULT_SESSION_ID = "default"
+MCP_MAX_SESSIONS = int(os.getenv("MCP_MAX_SESSIONS", "1000"))
+MCP_SESSION_TTL = float(os.getenv("MCP_SESSION_TTL", "3600"))
+# Times a turn is re-applied onto a session another worker changed meanwhile
+MCP_SESSION_COMMIT_RETRIES = int(os.getenv("MCP_SESSION_COMMIT_RETRIES", "3"))
+
+
+class SessionManager:
+    """Registry of per-session MCP instances with LRU and idle-TTL eviction.
+
+    Every session gets its own memory and context manager, while the LLM,
+    tools and worker pool are shared with the base MCP.
+
+    With a shared `state` backend (see session_state.py) the sessions held
+    here are a local cache: each get() compares the stored version with the
+    cached one and reloads only when another worker has changed the
+    session, and commit() writes the session back after a turn. If another
+    worker saved the session in the meantime, commit() reloads it, re-applies
+    the exchanges added since the last load or save, and saves again.
+    """
+
+    def __init__(self, base, max_sessions=MCP_MAX_SESSIONS, ttl=MCP_SESSION_TTL, state=None):
+        self.base = base
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.state = state if state is not None else InProcessSessionState()
+        # session_id -> (mcp, last_used), least recently used first
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id=None):
+        """Return the MCP for a session, creating it if needed."""
+        session_id = session_id or DEFAULT_SESSION_ID
+        now = time.monotonic()
+        with self.lock:
+            self._evict_expired(now)
+            entry = self.sessions.pop(session_id, None)
+            created = entry is None
+            if created:
+                mcp = self.base.fork(session_id)
+                # Held until the session is loaded, so concurrent callers wait for it
+                mcp.state_lock.acquire()
+            else:
+                mcp = entry[0]
+            self.sessions[session_id] = (mcp, now)
+
+            while len(self.sessions) > self.max_sessions:
+                evicted_id, (evicted, _) = self.sessions.popitem(last=False)
+                evicted.context_manager.release()
+                logger.info(f"Evicted least recently used session {evicted_id}")
+
+        if created:
+            try:
+                if not self._refresh(session_id, mcp):
+                    restored = mcp.restore_history()
+                    logger.info(f"Created session {session_id} ({restored} exchanges restored)")
+            finally:
+                mcp.state_lock.release()
+        else:
+            # Also waits for a concurrent caller that is still loading the session
+            with mcp.state_lock:
+                self._refresh(session_id, mcp)
+        return mcp
+
+    async def aget(self, session_id=None):
+        """get() that keeps shared-state reads and history restores off the event loop."""
+        if not self.state.shared and self.base.context_store is None:
+            return self.get(session_id)
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, session_id)
+
+    def _refresh(self, session_id, mcp):
+        """Reload a session if the stored copy is newer. Returns True if a stored copy exists."""
+        if not self.state.shared:
+            return False
+        try:
+            version = self.state.version(session_id)
+            if version is None:
+                return False
+            if version != mcp.state_version:
+                loaded = self.state.load(session_id)
+                if loaded is None:
+                    return False
+                mcp.state_version, state = loaded
+                mcp.import_state(state)
+                mcp.state_synced = mcp.context_manager.context.total
+                logger.debug(f"Reloaded session {session_id} at version {mcp.state_version}")
+            return True
+        except Exception as e:
+            # Keep serving the local copy
+            logger.error(f"Error reading state of session {session_id}: {str(e)}")
+            return mcp.state_version is not None
+
+    def commit(self, session_id, mcp):
+        """Write a session back to the shared backend. Returns False if it was not saved."""
+        if not self.state.shared:
+            return True
+        session_id = session_id or DEFAULT_SESSION_ID
+        with mcp.state_lock:
+            for attempt in range(MCP_SESSION_COMMIT_RETRIES + 1):
+                try:
+                    mcp.state_version = self.state.save(session_id, mcp.export_state(), mcp.state_version)
+                    mcp.state_synced = mcp.context_manager.context.total
+                    return True
+                except StateConflict:
+                    if attempt == MCP_SESSION_COMMIT_RETRIES:
+                        break
+                    # Another worker ran a turn on this session at the same time; add ours on top of its state
+                    logger.warning(f"Session {session_id} was changed by another worker, re-applying this turn")
+                    if not self._rebase(session_id, mcp):
+                        return False
+                except Exception as e:
+                    logger.error(f"Error saving state of session {session_id}: {str(e)}")
+                    return False
+            logger.error(f"Gave up saving session {session_id} after {MCP_SESSION_COMMIT_RETRIES} conflicts")
+            return False
+
+    def _rebase(self, session_id, mcp):
+        """Reload a session and replay the exchanges added since its last load or save."""
+        context = mcp.context_manager.context
+        unsaved = context.entries(max(0, mcp.state_synced - context.oldest_seq()))
+        version = mcp.state_version
+        self._refresh(session_id, mcp)
+        if mcp.state_version == version:
+            # The reload failed; keep the local copy rather than replaying onto it twice
+            return False
+        mcp.replay_exchanges(unsaved)
+        return True
+
+    async def acommit(self, session_id, mcp):
+        """commit() that keeps shared-state writes off the event loop."""
+        if not self.state.shared:
+            return True
+        return await asyncio.get_running_loop().run_in_executor(None, self.commit, session_id, mcp)
+
+    def remove(self, session_id):
+        """Drop a session. Returns True if it existed."""
+        with self.lock:
+            entry = self.sessions.pop(session_id or DEFAULT_SESSION_ID, None)
+        if entry is None:
+            return False
+        entry[0].context_manager.release()
+        return True
+
+    def _evict_expired(self, now):
+        if self.ttl <= 0:
+            return
+        # Entries are ordered by last use, so expired ones are at the front
+        while self.sessions:
+            session_id, (mcp, last_used) = next(iter(self.sessions.items()))
+            if now - last_used < self.ttl:
+                break
+            self.sessions.popitem(last=False)
+            mcp.context_manager.release()
+            logger.info(f"Evicted idle session {session_id}")
+
+    def __len__(self):
+        return len(self.sessions)
@@ -0,0 +1,106 @@
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from database import SessionState
+import json
+import os
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# memory keeps sessions inside one process; sqlite or postgres share them between workers
+MCP_SESSION_STATE = os.getenv("MCP_SESSION_STATE", "memory").lower()
+# Database used by MCP_SESSION_STATE=sqlite; every worker on the host must point at the same file
+MCP_SESSION_STATE_URL = os.getenv("MCP_SESSION_STATE_URL", "sqlite:///session_state.db")
+
+
+class StateConflict(Exception):
+    """Another worker saved the session since this worker last read it."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        super().__init__(f"Session {session_id} was modified concurrently")
+
+
+class InProcessSessionState:
+    """Default backend: state lives only in this process's MCP objects."""
+
+    shared = False
+
+    def version(self, session_id):
+        return None
+
+    def load(self, session_id):
+        return None
+
+    def save(self, session_id, state, expected_version):
+        return expected_version
+
+
+class SQLSessionState:
+    """Session state in a SQL table, so any worker can serve any session.
+
+    Every save bumps the row's version. Saves are optimistic: they only
+    succeed if the version is still the one the worker last read, otherwise
+    StateConflict is raised.
+    """
+
+    shared = True
+
+    def __init__(self, engine):
+        self.engine = engine
+        SessionState.__table__.create(engine, checkfirst=True)
+
+    def version(self, session_id):
+        """Return the stored version of a session, or None if it was never saved."""
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(SessionState.version).where(SessionState.session_id == session_id)
+            ).scalar()
+
+    def load(self, session_id):
+        """Return (version, state) of a session, or None if it was never saved."""
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                select(SessionState.version, SessionState.state).where(SessionState.session_id == session_id)
+            ).first()
+        if row is None:
+            return None
+        return row.version, json.loads(row.state)
+
+    def save(self, session_id, state, expected_version):
+        """Store a session's state and return its new version."""
+        payload = json.dumps(state)
+        now = datetime.now(timezone.utc)
+        with self.engine.begin() as connection:
+            if expected_version is None:
+                try:
+                    connection.execute(insert(SessionState).values(
+                        session_id=session_id, version=1, state=payload, updated_at=now
+                    ))
+                except IntegrityError:
+                    raise StateConflict(session_id)
+                return 1
+            result = connection.execute(
+                update(SessionState)
+                .where(SessionState.session_id == session_id, SessionState.version == expected_version)
+                .values(version=SessionState.version + 1, state=payload, updated_at=now)
+            )
+            if result.rowcount == 0:
+                raise StateConflict(session_id)
+            return expected_version + 1
+
+
+def create_session_state():
+    """Create the session-state backend selected by MCP_SESSION_STATE."""
+    if MCP_SESSION_STATE == "postgres":
+        from database import get_engine
+        return SQLSessionState(get_engine())
+    if MCP_SESSION_STATE == "sqlite":
+        return SQLSessionState(create_engine(MCP_SESSION_STATE_URL))
+    return InProcessSessionState()
@@ -0,0 +1,305 @@
+from langchain_community.utilities.sql_database import SQLDatabase
+from collections import OrderedDict
+from sqlalchemy import inspect
+import re
+import threading
+import time
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+READ_ONLY_STATEMENTS = ("select", "with", "show", "explain")
+WRITE_STATEMENTS = (
+    "insert", "update", "delete", "merge", "truncate", "copy",
+    "create", "alter", "drop", "rename", "grant", "revoke", "vacuum", "refresh",
+)
+# Statements that may change the table list or table definitions
+SCHEMA_STATEMENTS = ("create", "drop", "alter", "rename")
+# Functions whose result differs between calls, so queries using them are never cached
+VOLATILE_FUNCTIONS = (
+    "nextval", "setval", "currval", "lastval", "now", "current_timestamp", "current_date",
+    "current_time", "localtime", "localtimestamp", "clock_timestamp", "statement_timestamp",
+    "transaction_timestamp", "timeofday", "random", "gen_random_uuid", "uuid_generate_v4",
+    "txid_current", "pg_sleep",
+)
+
+_QUOTED_RE = re.compile(r"('(?:[^']|'')*')")
+_TABLE_RE = re.compile(
+    r"\b(?:from|join|into|update|table|truncate)\s+(?:only\s+|if\s+(?:not\s+)?exists\s+)?"
+    r"((?:\"[^\"]+\"|[\w$]+)(?:\.(?:\"[^\"]+\"|[\w$]+))?)",
+    re.IGNORECASE,
+)
+_LIMIT_RE = re.compile(r"\blimit\s+(\d+)\s*(?:offset\s+\d+\s*)?$", re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Collapse whitespace outside string literals and drop trailing semicolons."""
+    parts = _QUOTED_RE.split(sql.strip().rstrip(";").strip())
+    # Odd indices are quoted literals and are kept verbatim
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part)
+        for i, part in enumerate(parts)
+    ).strip()
+
+
+def _strip_literals(sql):
+    return "".join(part for i, part in enumerate(_QUOTED_RE.split(sql)) if i % 2 == 0)
+
+
+_WRITE_RE = re.compile(rf"\b(?:{'|'.join(WRITE_STATEMENTS)})\b", re.IGNORECASE)
+# SELECT ... INTO creates a table
+_INTO_RE = re.compile(r"\binto\b", re.IGNORECASE)
+_VOLATILE_RE = re.compile(rf"\b(?:{'|'.join(VOLATILE_FUNCTIONS)})\b", re.IGNORECASE)
+
+
+def is_write(sql):
+    """Return True if a statement may modify data or schema."""
+    if statement_kind(sql) not in READ_ONLY_STATEMENTS:
+        return True
+    stripped = _strip_literals(sql)
+    return bool(_WRITE_RE.search(stripped) or _INTO_RE.search(stripped))
+
+
+def is_cacheable(sql):
+    """Return True if a statement's result can be served from the cache."""
+    return not is_write(sql) and not _VOLATILE_RE.search(_strip_literals(sql))
+
+
+def statement_kind(sql):
+    """Return the leading keyword of a statement, lowercased."""
+    match = re.match(r"\s*\(?\s*(\w+)", sql)
+    return match.group(1).lower() if match else ""
+
+
+def referenced_tables(sql):
+    """Return the unqualified, lowercased names of tables a statement touches."""
+    tables = set()
+    for name in _TABLE_RE.findall(_strip_literals(sql)):
+        tables.add(name.split(".")[-1].strip('"').lower())
+    return tables
+
+
+class QueryResultCache:
+    """LRU cache of read-only query results with TTL and table-level invalidation."""
+
+    def __init__(self, max_entries=500, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> entry dict, least recently used first
+        self.entries = OrderedDict()
+        # table name -> set of keys whose query reads it
+        self.table_index = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl > 0 and time.monotonic() - entry["cached_at"] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, sql, result):
+        tables = referenced_tables(sql)
+        limit = _LIMIT_RE.search(sql)
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = {
+                "cached_at": time.monotonic(),
+                "tables": tables,
+                "row_limit": int(limit.group(1)) if limit else None,
+                "result": result,
+            }
+            for table in tables:
+                self.table_index.setdefault(table, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate_tables(self, tables):
+        """Drop every entry that reads any of the given tables."""
+        with self.lock:
+            keys = set()
+            for table in tables:
+                keys |= self.table_index.get(table, set())
+            for key in keys:
+                self._remove(key)
+        if keys:
+            logger.info(f"Invalidated {len(keys)} cached query results for tables {sorted(tables)}")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.table_index.clear()
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for table in entry["tables"]:
+            keys = self.table_index.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.table_index[table]
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+class CachedSQLDatabase(SQLDatabase):
+    """SQLDatabase that answers table listing and schema lookups from memory.
+
+    `get_table_info` renders (and samples rows for) each table once, then
+    serves it from the cache until `schema_ttl` seconds pass or the table is
+    invalidated. A schema_ttl of 0 keeps entries until invalidated.
+
+    With `result_cache_size` > 0, results of read-only queries sent through
+    `run` (the sql_db_query tool) are cached too, and writes through `run`
+    evict results of the tables they touch.
+    """
+
+    def __init__(self, engine, schema_ttl=0, result_cache_size=0, result_ttl=60, **kwargs):
+        super().__init__(engine, **kwargs)
+        self.schema_ttl = schema_ttl
+        self.result_cache = QueryResultCache(result_cache_size, result_ttl) if result_cache_size > 0 else None
+        # table name -> (cached_at, table info)
+        self._table_info_cache = {}
+        self._table_names_cache = None
+        self._cache_lock = threading.Lock()
+        # Guards self._metadata, which rendering reads and invalidation changes
+        self._metadata_lock = threading.Lock()
+
+    def _is_fresh(self, cached_at):
+        return self.schema_ttl <= 0 or time.monotonic() - cached_at < self.schema_ttl
+
+    def get_usable_table_names(self):
+        """Get names of tables available, from the cache when fresh."""
+        cached = self._table_names_cache
+        if cached is not None and self._is_fresh(cached[0]):
+            return cached[1]
+        names = super().get_usable_table_names()
+        self._table_names_cache = (time.monotonic(), names)
+        return names
+
+    def get_table_info(self, table_names=None):
+        """Get information about specified tables, rendering only uncached ones."""
+        if table_names is None:
+            table_names = self.get_usable_table_names()
+
+        infos = []
+        for table in table_names:
+            with self._cache_lock:
+                cached = self._table_info_cache.get(table)
+            if cached is None or not self._is_fresh(cached[0]):
+                with self._metadata_lock:
+                    if cached is not None:
+                        # Expired: reflect the table again so column changes show up
+                        self._forget_tables([table])
+                    # Raises ValueError for unknown tables, same as SQLDatabase
+                    info = super().get_table_info([table])
+                cached = (time.monotonic(), info)
+                with self._cache_lock:
+                    self._table_info_cache[table] = cached
+            infos.append(cached[1])
+        return "\n\n".join(infos)
+
+    def run(self, command, fetch="all", include_columns=False, *, parameters=None, execution_options=None):
+        """Execute a SQL command, serving read-only queries from the result cache."""
+        if self.result_cache is None or not isinstance(command, str) or parameters:
+            return super().run(command, fetch, include_columns, parameters=parameters, execution_options=execution_options)
+
+        sql = normalize_sql(command)
+        # fetch="cursor" returns a Result that is exhausted after one use
+        if fetch in ("all", "one") and is_cacheable(sql):
+            key = (sql, fetch, include_columns, self._max_string_length)
+            entry = self.result_cache.get(key)
+            if entry is not None:
+                return entry["result"]
+            result = super().run(command, fetch, include_columns, execution_options=execution_options)
+            self.result_cache.set(key, sql, result)
+            return result
+
+        result = super().run(command, fetch, include_columns, execution_options=execution_options)
+        if is_write(sql):
+            self._on_write(sql)
+        return result
+
+    def _on_write(self, sql):
+        kind = statement_kind(sql)
+        tables = referenced_tables(sql)
+        if tables:
+            self.result_cache.invalidate_tables(tables)
+        else:
+            # Can't tell what changed, so drop everything
+            self.result_cache.clear()
+        if kind in SCHEMA_STATEMENTS or (kind in READ_ONLY_STATEMENTS and _INTO_RE.search(_strip_literals(sql))):
+            # The table list itself may have changed
+            self.invalidate()
+        elif tables:
+            # Cached table info includes sample rows, so refresh those tables too
+            self.invalidate(sorted(tables))
+
+    def warm(self):
+        """Populate the cache for every usable table."""
+        start = time.monotonic()
+        self.get_table_info()
+        logger.info(
+            f"Schema cache warmed with {len(self._table_info_cache)} tables "
+            f"in {time.monotonic() - start:.2f}s"
+        )
+
+    def invalidate(self, table_names=None):
+        """Drop cached schema info for the given tables, or everything.
+
+        A full invalidation also re-reflects the catalog so new and dropped
+        tables are picked up.
+        """
+        with self._metadata_lock:
+            if table_names is None:
+                with self._cache_lock:
+                    self._table_info_cache.clear()
+                    self._table_names_cache = None
+                self._reflect()
+            else:
+                with self._cache_lock:
+                    for table in table_names:
+                        self._table_info_cache.pop(table, None)
+                # SQLDatabase reflects tables missing from the metadata when it next renders them
+                self._forget_tables(table_names)
+        logger.info(f"Schema cache invalidated: {table_names or 'all tables'}")
+
+    def _forget_tables(self, table_names):
+        names = set(table_names)
+        for table in [table for table in self._metadata.sorted_tables if table.name in names]:
+            self._metadata.remove(table)
+
+    def _reflect(self):
+        inspector = inspect(self._engine)
+        self._all_tables = set(inspector.get_table_names(schema=self._schema))
+        if self._view_support:
+            self._all_tables |= set(inspector.get_view_names(schema=self._schema))
+        self._usable_tables = set(self.get_usable_table_names())
+        self._metadata.clear()
+        self._metadata.reflect(
+            views=self._view_support,
+            bind=self._engine,
+            only=list(self._usable_tables),
+            schema=self._schema,
+        )
+
+    def get_cache_stats(self):
+        """Return schema and query result cache counters."""
+        stats = {"cached_tables": len(self._table_info_cache)}
+        if self.result_cache is not None:
+            stats["query_results"] = self.result_cache.get_stats()
+        return stats
@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("langchain_community")
+
+from sql_cache import is_cacheable, is_write, normalize_sql, referenced_tables
+
+
+@pytest.mark.parametrize("sql, write, tables", [
+    ("SELECT * FROM t", False, {"t"}),
+    ("select id from a join b on a.id = b.id", False, {"a", "b"}),
+    ("(SELECT id FROM a) UNION (SELECT id FROM b)", False, {"a", "b"}),
+    # Keywords inside string literals don't count
+    ("SELECT * FROM t WHERE note = 'delete me'", False, {"t"}),
+    # Writes hidden in a CTE
+    ("WITH x AS (DELETE FROM t RETURNING *) SELECT * FROM x", True, {"t", "x"}),
+    ("WITH x AS (SELECT 1) INSERT INTO t SELECT * FROM x", True, {"t", "x"}),
+    # SELECT ... INTO creates a table
+    ("SELECT * INTO new_t FROM t", True, {"new_t", "t"}),
+    # Row locks must reach the database every time
+    ("SELECT * FROM t FOR UPDATE", True, {"t"}),
+    # Quoted and schema-qualified names
+    ('SELECT * FROM "Order Items"', False, {"order items"}),
+    ('SELECT * FROM public.users u JOIN "Sales"."Orders" o ON o.uid = u.id', False, {"users", "orders"}),
+    ("UPDATE public.users SET name = 'x'", True, {"users"}),
+    ("ALTER TABLE ONLY t ADD COLUMN c INT", True, {"t"}),
+    ("DROP TABLE IF EXISTS old_t", True, {"old_t"}),
+    ("TRUNCATE t", True, {"t"}),
+])
+def test_write_detection_and_tables(sql, write, tables):
+    assert is_write(sql) is write
+    assert referenced_tables(sql) == tables
+
+
+@pytest.mark.parametrize("sql, cacheable", [
+    ("SELECT * FROM t", True),
+    ("SELECT * FROM t FOR UPDATE", False),
+    ("SELECT * INTO new_t FROM t", False),
+    ("SELECT now(), * FROM t", False),
+    ("SELECT nextval('seq')", False),
+    ("SELECT * FROM t WHERE note = 'random'", True),
+])
+def test_is_cacheable(sql, cacheable):
+    assert is_cacheable(sql) is cacheable
+
+
+@pytest.mark.parametrize("sql, normalized", [
+    ("  SELECT  *\n FROM t ;", "SELECT * FROM t"),
+    ("SELECT * FROM t WHERE a = 'x  y';;", "SELECT * FROM t WHERE a = 'x  y'"),
+    ("SELECT 'it''s  here'", "SELECT 'it''s  here'"),
+])
+def test_normalize_sql(sql, normalized):
+    assert normalize_sql(sql) == normalized
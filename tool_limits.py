@@ -0,0 +1,159 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextvars import copy_context
+from inspect import signature
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from typing import Any, Optional
+from budgets import current_budget, current_call_pids
+import asyncio
+import threading
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Runs sync tool calls that have a timeout, so the caller can stop waiting
+_timeout_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="mcp-tool")
+
+
+def parse_limits(spec):
+    """Parse "sql=2,default=4" into {"sql": 2.0, "default": 4.0}."""
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            group, value = item.split("=", 1)
+            limits[group.strip()] = float(value)
+    return limits
+
+
+def tool_group(tool):
+    """Group tools that share a backend: all sql_db_* tools are "sql"."""
+    if tool.name.startswith("sql_db"):
+        return "sql"
+    return tool.name
+
+
+class LimitedTool(BaseTool):
+    """Wraps a tool with a per-group concurrency limit and a per-call timeout.
+
+    BaseTool.run/arun parse the input and fire the tool callbacks; _run
+    and _arun then call the wrapped tool's own _run/_arun. The sync and
+    async paths each have their own concurrency limit of the same size.
+    The timeout is capped by the time left on the request budget. A call
+    that times out returns an error message to the agent instead of
+    raising, so the agent can still answer.
+    """
+
+    inner: BaseTool
+    sync_limit: Any = None
+    async_limit: Any = None
+    timeout: Optional[float] = None
+
+    def _effective_timeout(self):
+        budget = current_budget.get()
+        remaining = budget.remaining() if budget is not None else None
+        if self.timeout is None:
+            return remaining
+        return self.timeout if remaining is None else min(self.timeout, remaining)
+
+    def _timed_out(self, timeout, pids):
+        # Abandoning the call would leave its SQL running; cancel what it still holds
+        if pids:
+            try:
+                from database import cancel_backends
+                cancel_backends(set(pids))
+            except Exception as e:
+                logger.error(f"Error cancelling backends of tool {self.name}: {str(e)}")
+        budget = current_budget.get()
+        if budget is not None:
+            budget.record(f"tool_timeout:{self.name}")
+        return f"Error: tool {self.name} timed out after {timeout:.1f}s"
+
+    def _run(self, *args, config: RunnableConfig, run_manager=None, **kwargs):
+        kwargs = _forwarded(self.inner._run, kwargs, config, run_manager)
+        if self.sync_limit is not None:
+            self.sync_limit.acquire()
+        future = None
+        try:
+            timeout = self._effective_timeout()
+            if timeout is None:
+                return self.inner._run(*args, **kwargs)
+            pids = set()
+            future = _timeout_executor.submit(copy_context().run, _tracked, pids, self.inner._run, *args, **kwargs)
+            if self.sync_limit is not None:
+                # The slot stays taken until the worker is done, even if the caller stops waiting
+                future.add_done_callback(lambda _: self.sync_limit.release())
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeoutError:
+                return self._timed_out(timeout, pids)
+        finally:
+            if self.sync_limit is not None and future is None:
+                self.sync_limit.release()
+
+    async def _arun(self, *args, config: RunnableConfig, run_manager=None, **kwargs):
+        kwargs = _forwarded(self.inner._arun, kwargs, config, run_manager)
+        if self.async_limit is None:
+            return await self._arun_with_timeout(*args, **kwargs)
+        async with self.async_limit:
+            return await self._arun_with_timeout(*args, **kwargs)
+
+    async def _arun_with_timeout(self, *args, **kwargs):
+        timeout = self._effective_timeout()
+        pids = set()
+        try:
+            return await asyncio.wait_for(_atracked(pids, self.inner._arun, *args, **kwargs), timeout)
+        except asyncio.TimeoutError:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, copy_context().run, self._timed_out, timeout, pids)
+
+
+def _tracked(pids, fn, *args, **kwargs):
+    """Run fn with the Postgres backends it checks out recorded in pids."""
+    current_call_pids.set(pids)
+    return fn(*args, **kwargs)
+
+
+async def _atracked(pids, fn, *args, **kwargs):
+    # wait_for runs this in its own task, so the context var does not leak to the caller
+    current_call_pids.set(pids)
+    return await fn(*args, **kwargs)
+
+
+def _forwarded(method, kwargs, config, run_manager):
+    """Add run_manager and config for a wrapped tool method that takes them, as BaseTool.run does."""
+    params = signature(method).parameters
+    kwargs = dict(kwargs)
+    if "run_manager" in params:
+        kwargs["run_manager"] = run_manager
+    if "config" in params:
+        kwargs["config"] = config
+    return kwargs
+
+
+def limit_tools(tools, concurrency, timeouts):
+    """Wrap tools whose group (or "default") has a concurrency limit or timeout."""
+    semaphores = {}
+    limited = []
+    for tool in tools:
+        group = tool_group(tool)
+        limit = concurrency.get(group, concurrency.get("default"))
+        timeout = timeouts.get(group, timeouts.get("default"))
+        if not limit and not timeout:
+            limited.append(tool)
+            continue
+        if limit and group not in semaphores:
+            semaphores[group] = (threading.BoundedSemaphore(int(limit)), asyncio.Semaphore(int(limit)))
+        sync_limit, async_limit = semaphores.get(group, (None, None))
+        limited.append(LimitedTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            inner=tool,
+            sync_limit=sync_limit,
+            async_limit=async_limit,
+            timeout=timeout or None,
+        ))
+    logger.info(f"Tool limits: concurrency={concurrency}, timeouts={timeouts}")
+    return limited
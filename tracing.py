@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from metrics import DB_QUERY_DURATION
+import json
+import os
+import threading
+import time
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("mcp.trace")
+
+load_dotenv()
+
+# MCP_TRACE_LOG=true logs every request's span tree as one JSON line
+MCP_TRACE_LOG = os.getenv("MCP_TRACE_LOG", "false").lower() == "true"
+
+# Trace of the request being processed; copied into tool and DB worker threads
+current_trace = ContextVar("request_trace", default=None)
+
+
+class Span:
+    __slots__ = ("name", "kind", "start", "end", "status", "attributes", "children")
+
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.end = None
+        self.status = "ok"
+        self.attributes = {}
+        self.children = []
+
+    def finish(self, status="ok"):
+        self.end = time.perf_counter()
+        self.status = status
+        return self.end - self.start
+
+    def to_dict(self, origin):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "start_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round(((self.end or time.perf_counter()) - self.start) * 1000, 2),
+            "status": self.status,
+            **({"attributes": self.attributes} if self.attributes else {}),
+            **({"children": [child.to_dict(origin) for child in self.children]} if self.children else {}),
+        }
+
+
+class RequestTrace:
+    """Span tree and counters of one request: LLM calls, tools, DB time, cache hits, queue wait."""
+
+    def __init__(self, name, session_id=None):
+        self.root = Span(name, "request")
+        self.session_id = session_id
+        # LangChain run_id -> span
+        self.spans = {}
+        self.queue_wait = 0.0
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.lock = threading.Lock()
+
+    def start_span(self, run_id, parent_run_id, name, kind):
+        span = Span(name, kind)
+        with self.lock:
+            parent = self.spans.get(parent_run_id, self.root)
+            parent.children.append(span)
+            self.spans[run_id] = span
+        return span
+
+    def end_span(self, run_id, status="ok"):
+        with self.lock:
+            span = self.spans.get(run_id)
+        if span is None:
+            return None, 0.0
+        return span, span.finish(status)
+
+    def add_db_time(self, seconds):
+        with self.lock:
+            self.db_time += seconds
+            self.db_queries += 1
+
+    def to_dict(self):
+        return {
+            "session_id": self.session_id,
+            "queue_wait_ms": round(self.queue_wait * 1000, 2),
+            "db_time_ms": round(self.db_time * 1000, 2),
+            "db_queries": self.db_queries,
+            "llm_cache_hits": self.cache_hits,
+            "llm_cache_misses": self.cache_misses,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "span": self.root.to_dict(self.root.start),
+        }
+
+
+@contextmanager
+def request_trace(name, session_id=None):
+    """Use the current request trace, or start one that is logged when the block ends."""
+    trace = current_trace.get()
+    if trace is not None:
+        yield trace
+        return
+    trace = RequestTrace(name, session_id)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+        log_trace(trace)
+
+
+def log_trace(trace):
+    """Finish a trace and log it as JSON if MCP_TRACE_LOG is on."""
+    trace.root.finish()
+    if MCP_TRACE_LOG:
+        trace_logger.info(json.dumps(trace.to_dict()))
+
+
+def record_cache_lookup(hit):
+    trace = current_trace.get()
+    if trace is not None:
+        if hit:
+            trace.cache_hits += 1
+        else:
+            trace.cache_misses += 1
+
+
+def record_db_time(seconds):
+    DB_QUERY_DURATION.observe(seconds)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_db_time(seconds)